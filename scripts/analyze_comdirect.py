@@ -4,100 +4,150 @@ Analyze comdirect transaction CSV to find buy/sell transaction pairs for securit
 Handles German number format (comma as decimal separator) and date format (DD.MM.YYYY).
 """
 
-import csv
-from datetime import datetime
-from decimal import Decimal, InvalidOperation
-from collections import defaultdict
-from typing import Dict, List, Tuple
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
 import sys
 
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.trade_analysis import (
+    ColumnMapping,
+    fifo_match,
+    format_german_dates,
+    parse_german_dates,
+    parse_german_numbers,
+    read_header,
+    resolve_columns,
+    write_results_csv,
+)
+
+TRADE_TYPES = frozenset({'Kauf', 'Verkauf'})
+
+# Logical column name -> predicate matching the raw header. The first matching
+# header wins, mirroring how the export's encoding variants were detected before.
+COLUMN_MATCHERS = (
+    ('settlement_date', lambda c: c == 'Abrechnungstag'),
+    ('execution_date', lambda c: 'hrung' in c and 'W' not in c or 'Ausf' in c),
+    ('wkn', lambda c: c == 'WKN'),
+    ('isin', lambda c: c == 'ISIN'),
+    ('security_name', lambda c: c == 'Bezeichnung'),
+    ('transaction_type', lambda c: 'art' in c),
+    ('shares', lambda c: 'cke' in c or 'Nom' in c),
+    ('price', lambda c: c == 'Kurs'),
+    ('currency', lambda c: 'hrung' in c and 'W' in c),
+    ('customer_amount', lambda c: c == 'Kundenendbetrag EUR'),
+)
+TEXT_COLUMNS = ('settlement_date', 'execution_date', 'wkn', 'isin', 'security_name',
+                'transaction_type', 'currency')
+NUMERIC_COLUMNS = ('shares', 'price', 'customer_amount')
+
+
+@dataclass(frozen=True, slots=True)
+class ResolvedColumns(ColumnMapping):
+    """Actual CSV header for each logical column (None when the export lacks it)."""
+
+    settlement_date: Optional[str]
+    execution_date: Optional[str]
+    wkn: Optional[str]
+    isin: Optional[str]
+    security_name: Optional[str]
+    transaction_type: Optional[str]
+    shares: Optional[str]
+    price: Optional[str]
+    currency: Optional[str]
+    customer_amount: Optional[str]
+
+
+def _resolve_columns(fieldnames: List[str]) -> ResolvedColumns:
+    """Resolve the fuzzy header matches once per file instead of once per row."""
+    return ResolvedColumns(**resolve_columns(fieldnames, COLUMN_MATCHERS))
+
+
+def _read_transactions(filepath: str, encoding: str) -> pd.DataFrame:
+    """Read the export in one vectorized pass and return Kauf/Verkauf rows."""
+    mapping = _resolve_columns(read_header(filepath, encoding)).mapping()
+    # Dates and identifiers must stay text, otherwise thousands='.' turns
+    # DD.MM.YYYY into integers.
+    dtype = {raw: 'string' for raw, logical in mapping.items() if logical in TEXT_COLUMNS}
+    df = pd.read_csv(
+        filepath,
+        sep=';',
+        encoding=encoding,
+        decimal=',',
+        thousands='.',
+        dtype=dtype,
+        usecols=list(mapping),
+    ).rename(columns=mapping)
+
+    for logical in TEXT_COLUMNS:
+        if logical not in df.columns:
+            df[logical] = pd.NA
+
+    # Drop dividends, fees etc. before any per-column conversion work
+    df = df[df['transaction_type'].isin(TRADE_TYPES)].copy()
+
+    for logical in NUMERIC_COLUMNS:
+        if logical in df.columns:
+            df[logical] = parse_german_numbers(df[logical])
+        else:
+            df[logical] = 0.0
+
+    df['settlement_date'] = parse_german_dates(df['settlement_date'])
+    df['execution_date'] = parse_german_dates(df['execution_date'])
+    df['execution_date'] = df['execution_date'].fillna(df['settlement_date'])
+    df['currency'] = df['currency'].fillna('EUR')
+
+    invalid = df['settlement_date'].isna()
+    if invalid.any():
+        print(f"Warning: Skipped {int(invalid.sum())} rows with an invalid settlement date")
+        df = df[~invalid]
+
+    # Use ISIN as key (or WKN if ISIN is empty)
+    isin = df['isin'].fillna('')
+    df['security_key'] = isin.where(isin != '', df['wkn'].fillna(''))
+    df['security_name'] = df['security_name'].fillna('')
+    df['settlement_date_text'] = format_german_dates(df['settlement_date'])
+    return df
+
+
+def _match_security(group: Tuple[np.ndarray, ...]) -> List[Tuple]:
+    """
+    FIFO-match the buys and sells of one security and return its result rows.
 
-def parse_german_decimal(value: str) -> Decimal:
-    """Convert German decimal format (47,53) to Decimal."""
-    if not value or value == '0':
-        return Decimal('0')
-    try:
-        # Replace comma with period and remove any thousand separators
-        value = value.replace('.', '').replace(',', '.')
-        return Decimal(value)
-    except (InvalidOperation, ValueError):
-        return Decimal('0')
-
-
-def parse_german_date(date_str: str) -> datetime:
-    """Parse German date format DD.MM.YYYY."""
-    return datetime.strptime(date_str, '%d.%m.%Y')
-
-
-def parse_shares(shares_str: str) -> Decimal:
-    """Parse share count, handling both integer and decimal values."""
-    try:
-        return parse_german_decimal(shares_str)
-    except:
-        return Decimal('0')
-
-
-class ComdirectTransaction:
-    """Represents a single comdirect transaction (buy or sell)."""
-    def __init__(self, row: Dict[str, str]):
-        self.settlement_date = parse_german_date(row['Abrechnungstag'])
-        
-        # Handle encoding issue - find execution date column
-        exec_key = None
-        for key in row.keys():
-            if 'hrung' in key or 'Ausf' in key:
-                exec_key = key
-                break
-        self.execution_date = parse_german_date(row[exec_key]) if exec_key else self.settlement_date
-        
-        self.wkn = row['WKN']
-        self.isin = row['ISIN']
-        self.security_name = row['Bezeichnung']
-        
-        # Handle encoding issue with "Geschäftsart"
-        transaction_key = None
-        for key in row.keys():
-            if 'art' in key:
-                transaction_key = key
-                break
-        self.transaction_type = row[transaction_key] if transaction_key else ''
-        
-        # Handle encoding issue with "Stücke/Nom."
-        shares_key = None
-        for key in row.keys():
-            if 'cke' in key or 'Nom' in key:
-                shares_key = key
-                break
-        self.shares = parse_shares(row[shares_key]) if shares_key else Decimal('0')
-        
-        self.price = parse_german_decimal(row['Kurs'])
-        
-        # Handle encoding issue with "Währung"
-        currency_key = None
-        for key in row.keys():
-            if 'hrung' in key and 'W' in key:
-                currency_key = key
-                break
-        self.currency = row[currency_key] if currency_key else 'EUR'
-        
-        # Kundenendbetrag is the final amount (negative for buy, positive for sell)
-        self.customer_amount = parse_german_decimal(row['Kundenendbetrag EUR'])
-        
-    def is_buy(self) -> bool:
-        """Check if this is a buy transaction."""
-        return self.transaction_type == 'Kauf'
-    
-    def is_sell(self) -> bool:
-        """Check if this is a sell transaction."""
-        return self.transaction_type == 'Verkauf'
-    
-    def get_price_per_share(self) -> Decimal:
-        """Get price per share from the Kurs column."""
-        return self.price
-    
-    def get_total_cost(self) -> Decimal:
-        """Get total cost including fees (absolute value)."""
-        return abs(self.customer_amount)
+    Takes plain arrays (buy shares/prices/dates, sell names/shares/prices/dates)
+    rather than DataFrame slices.
+    """
+    (buy_shares, buy_prices, buy_dates,
+     sell_names, sell_shares, sell_prices, sell_dates) = group
+    buy_idx, sell_idx, shares = fifo_match(buy_shares, sell_shares)
+    if len(sell_idx) == 0:
+        return []
+
+    # Gather per-match values by index; index -1 picks the trailing
+    # placeholder (unknown buy date/price) for shares bought before the data.
+    buy_dates = np.append(buy_dates, 'N/A (before data)')[buy_idx]
+    buy_prices = np.append(buy_prices, 0.0)[buy_idx]
+    sell_prices = sell_prices[sell_idx]
+
+    # Calculate invested value and realized P/L (unknown for unmatched shares)
+    invested = buy_prices * shares
+    realized = np.where(buy_idx >= 0, (sell_prices - buy_prices) * shares, 0.0)
+
+    # Quantize once per security instead of per match
+    return list(zip(
+        sell_names[sell_idx].tolist(),
+        buy_dates.tolist(),
+        buy_prices.tolist(),
+        np.round(shares, 6).tolist(),
+        np.round(invested, 2).tolist(),
+        sell_dates[sell_idx].tolist(),
+        sell_prices.tolist(),
+        np.round(realized, 2).tolist(),
+    ))
 
 
 def analyze_csv(filepath: str) -> List[Tuple]:
@@ -106,141 +156,75 @@ def analyze_csv(filepath: str) -> List[Tuple]:
     Returns list of (security_name, buy_date, buy_price, shares, sell_date, sell_price, realized_pl)
     """
     
-    # Dictionary to track transactions by security (ISIN is more reliable than WKN)
-    transactions_by_security = defaultdict(lambda: {'buys': [], 'sells': []})
-    
     # Read CSV with proper encoding
-    
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f, delimiter=';')
-            
-            for row in reader:
-                try:
-                    trans = ComdirectTransaction(row)
-                    
-                    # Use ISIN as key (or WKN if ISIN is empty)
-                    key = trans.isin if trans.isin else trans.wkn
-                    
-                    if trans.is_buy():
-                        transactions_by_security[key]['buys'].append(trans)
-                    elif trans.is_sell():
-                        transactions_by_security[key]['sells'].append(trans)
-                        
-                except Exception as e:
-                    # Skip rows that can't be parsed
-                    print(f"Warning: Could not parse row: {e}")
-                    continue
-                    
+        df = _read_transactions(filepath, 'utf-8')
     except UnicodeDecodeError:
         # Try Windows-1252 encoding if UTF-8 fails
-        with open(filepath, 'r', encoding='windows-1252') as f:
-            reader = csv.DictReader(f, delimiter=';')
-            
-            for row in reader:
-                try:
-                    trans = ComdirectTransaction(row)
-                    key = trans.isin if trans.isin else trans.wkn
-                    
-                    if trans.is_buy():
-                        transactions_by_security[key]['buys'].append(trans)
-                    elif trans.is_sell():
-                        transactions_by_security[key]['sells'].append(trans)
-                        
-                except Exception as e:
-                    continue
+        df = _read_transactions(filepath, 'windows-1252')
     
     # Match buy/sell pairs using FIFO (First In, First Out)
-    results = []
-    
-    for security_id, trans_dict in transactions_by_security.items():
-        buys = sorted(trans_dict['buys'], key=lambda x: x.settlement_date)
-        sells = sorted(trans_dict['sells'], key=lambda x: x.settlement_date)
-        
-        if not sells:
+    # Split buys and sells once for the whole file instead of masking every
+    # group; a stable date sort keeps the export order for same-day rows.
+    security_order = df['security_key'].unique()
+    df = df.sort_values('settlement_date', kind='stable')
+    all_buys = df[df['transaction_type'] == 'Kauf']
+    all_sells = df[df['transaction_type'] == 'Verkauf']
+    buy_rows = all_buys.groupby('security_key', sort=False).indices
+    sell_rows = all_sells.groupby('security_key', sort=False).indices
+    no_rows = np.empty(0, dtype=np.int64)
+    
+    # Pull every column out as one array (struct of arrays) and slice those
+    # per security, instead of going through pandas for each group
+    buy_columns = (
+        all_buys['shares'].to_numpy(dtype=np.float64),
+        all_buys['price'].to_numpy(dtype=np.float64),
+        all_buys['settlement_date_text'].to_numpy(dtype=object),
+    )
+    sell_columns = (
+        all_sells['security_name'].to_numpy(dtype=object),
+        all_sells['shares'].to_numpy(dtype=np.float64),
+        all_sells['price'].to_numpy(dtype=np.float64),
+        all_sells['settlement_date_text'].to_numpy(dtype=object),
+    )
+    
+    groups = []
+    for security_id in security_order:
+        if security_id not in sell_rows:
             # No sells for this security
             continue
-            
-        # For each sell, match with corresponding buys (FIFO)
-        for sell in sells:
-            if sell.shares == 0:
-                continue
-                
-            remaining_shares = sell.shares
-            sell_price_per_share = sell.get_price_per_share()
-            sell_total = sell.get_total_cost()
-            
-            # Track if we matched any buys
-            matched_any = False
-            
-            # Match with buys (FIFO)
-            for buy in buys:
-                if buy.shares == 0:
-                    continue
-                    
-                if remaining_shares <= 0:
-                    break
-                
-                matched_any = True
-                
-                # How many shares from this buy are we selling?
-                shares_to_match = min(remaining_shares, buy.shares)
-                buy_price_per_share = buy.get_price_per_share()
-                
-                # Calculate invested value and realized P/L
-                invested_value = buy_price_per_share * shares_to_match
-                realized_pl = (sell_price_per_share - buy_price_per_share) * shares_to_match
-                
-                results.append((
-                    sell.security_name,
-                    buy.settlement_date.strftime('%d.%m.%Y'),
-                    buy_price_per_share,
-                    shares_to_match,
-                    invested_value,
-                    sell.settlement_date.strftime('%d.%m.%Y'),
-                    sell_price_per_share,
-                    realized_pl
-                ))
-                
-                # Update remaining shares
-                buy.shares -= shares_to_match
-                remaining_shares -= shares_to_match
-            
-            # If we have unmatched shares, it means we're selling shares bought before our data period
-            if remaining_shares > 0:
-                # For unmatched shares, we can't calculate accurate P/L
-                # But we still report the sell
-                results.append((
-                    sell.security_name,
-                    'N/A (before data)',
-                    Decimal('0'),  # Unknown buy price
-                    remaining_shares,
-                    Decimal('0'),  # Unknown invested value
-                    sell.settlement_date.strftime('%d.%m.%Y'),
-                    sell_price_per_share,
-                    Decimal('0')  # Unknown P/L
-                ))
+        buys = buy_rows.get(security_id, no_rows)
+        sells = sell_rows[security_id]
+        groups.append(tuple(column[buys] for column in buy_columns)
+                      + tuple(column[sells] for column in sell_columns))
     
+    results = []
+    for group in groups:
+        results.extend(_match_security(group))
     return results
 
 
 def print_results(results: List[Tuple]):
     """Print results in a formatted table."""
-    print(f"\n{'Security':<40} {'Buy Date':<15} {'Buy Price':>12} {'Share Count':>12} {'Invested Value':>14} {'Sell Date':<15} {'Sell Price':>12} {'Realized P/L':>15}")
-    print("=" * 150)
+    # Collect the whole table and write it once instead of one print per row
+    lines = [
+        f"\n{'Security':<40} {'Buy Date':<15} {'Buy Price':>12} {'Share Count':>12} {'Invested Value':>14} {'Sell Date':<15} {'Sell Price':>12} {'Realized P/L':>15}",
+        "=" * 150,
+    ]
     
-    total_pl = Decimal('0')
-    known_pl_only = Decimal('0')
+    total_pl = 0.0
+    known_pl_only = 0.0
     
     for security, buy_date, buy_price, shares, invested_value, sell_date, sell_price, realized_pl in results:
-        print(f"{security:<40} {buy_date:<15} {buy_price:>12.2f} {shares:>12.3f} {invested_value:>14.2f} {sell_date:<15} {sell_price:>12.2f} {realized_pl:>15.2f}")
+        lines.append(f"{security:<40} {buy_date:<15} {buy_price:>12.2f} {shares:>12.3f} {invested_value:>14.2f} {sell_date:<15} {sell_price:>12.2f} {realized_pl:>15.2f}")
         total_pl += realized_pl
         if buy_date != 'N/A (before data)':
             known_pl_only += realized_pl
     
-    print("=" * 150)
-    print(f"{'Total Realized P/L (known transactions):':<133} {known_pl_only:>15.2f}")
-    print(f"{'Total Realized P/L (including N/A):':<133} {total_pl:>15.2f}")
+    lines.append("=" * 150)
+    lines.append(f"{'Total Realized P/L (known transactions):':<133} {known_pl_only:>15.2f}")
+    lines.append(f"{'Total Realized P/L (including N/A):':<133} {total_pl:>15.2f}")
+    sys.stdout.write('\n'.join(lines) + '\n')
 
 
 def main():
@@ -262,12 +246,7 @@ def main():
     
     # Also save to CSV
     output_file = r'd:\src\portfolio_tracker\data\comdirect_transaction_analysis.csv'
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['Security Name', 'Buy Date', 'Buy Price', 'Share Count', 'Invested Value', 'Sell Date', 'Sell Price', 'Realized P/L'])
-        
-        for row in results:
-            writer.writerow(row)
+    write_results_csv(output_file, ['Security Name', 'Buy Date', 'Buy Price', 'Share Count', 'Invested Value', 'Sell Date', 'Sell Price', 'Realized P/L'], results)
     
     print(f"\nResults saved to: {output_file}")
 
@@ -4,71 +4,142 @@ Analyze German tax export CSV to find buy/sell transaction pairs for securities.
 Handles German number format (comma as decimal separator) and date format (DD.MM.YYYY).
 """
 
-import csv
-from datetime import datetime
-from decimal import Decimal, InvalidOperation
-from collections import defaultdict
-from typing import Dict, List, Tuple
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
 import sys
 
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.trade_analysis import (
+    ColumnMapping,
+    fifo_match,
+    format_german_dates,
+    parse_german_dates,
+    parse_german_numbers,
+    read_header,
+    resolve_columns,
+    write_results_csv,
+)
+
+BUY_TYPES = frozenset({'Kauf', 'Kauf ausl.m.Ertragsant', 'Kauf inl. m.Ertragsant'})
+SELL_TYPES = frozenset({'Verkauf', 'Verkauf Investmentfonds'})
+TRADE_TYPES = BUY_TYPES | SELL_TYPES
+
+# Logical column name -> predicate matching the raw header. The first matching
+# header wins, which also covers the encoding variants of "Stück/Nominale".
+COLUMN_MATCHERS = (
+    ('date', lambda c: c == 'Buchungstag'),
+    ('tax_date', lambda c: c == 'Steuerliches Datum'),
+    ('transaction_type', lambda c: c == 'Vorgang'),
+    ('shares', lambda c: 'Nominale' in c),
+    ('security_name', lambda c: c == 'Bezeichnung'),
+    ('wkn', lambda c: c == 'WKN'),
+    ('gross_amount', lambda c: c == 'Betrag Brutto'),
+    ('realized_pl', lambda c: c == 'Gewinn/Verlust'),
+)
+TEXT_COLUMNS = ('date', 'tax_date', 'transaction_type', 'security_name', 'wkn')
+NUMERIC_COLUMNS = ('shares', 'gross_amount', 'realized_pl')
+
+
+@dataclass(frozen=True, slots=True)
+class ResolvedColumns(ColumnMapping):
+    """Actual CSV header for each logical column (None when the export lacks it)."""
+
+    date: Optional[str]
+    tax_date: Optional[str]
+    transaction_type: Optional[str]
+    shares: Optional[str]
+    security_name: Optional[str]
+    wkn: Optional[str]
+    gross_amount: Optional[str]
+    realized_pl: Optional[str]
+
+
+def _resolve_columns(fieldnames: List[str]) -> ResolvedColumns:
+    """Resolve the fuzzy header matches once per file instead of once per row."""
+    return ResolvedColumns(**resolve_columns(fieldnames, COLUMN_MATCHERS))
+
+
+def _read_transactions(filepath: str, encoding: str) -> pd.DataFrame:
+    """Read the export in one vectorized pass and return buy/sell rows."""
+    mapping = _resolve_columns(read_header(filepath, encoding)).mapping()
+    # Dates and identifiers must stay text, otherwise thousands='.' turns
+    # DD.MM.YYYY into integers.
+    dtype = {raw: 'string' for raw, logical in mapping.items() if logical in TEXT_COLUMNS}
+    df = pd.read_csv(
+        filepath,
+        sep=';',
+        encoding=encoding,
+        decimal=',',
+        thousands='.',
+        dtype=dtype,
+        usecols=list(mapping),
+    ).rename(columns=mapping)
+
+    for logical in TEXT_COLUMNS:
+        if logical not in df.columns:
+            df[logical] = pd.NA
+
+    # Only track actual buy/sell transactions; filter before converting anything
+    df = df[df['transaction_type'].isin(TRADE_TYPES)].copy()
+
+    for logical in NUMERIC_COLUMNS:
+        if logical in df.columns:
+            df[logical] = parse_german_numbers(df[logical])
+        else:
+            df[logical] = 0.0
+
+    df['date'] = parse_german_dates(df['date'])
+    df['tax_date'] = parse_german_dates(df['tax_date'])
+    df = df[df['date'].notna() & df['tax_date'].notna()].copy()
+
+    # Price per share = gross amount / shares
+    shares = df['shares'].where(df['shares'] != 0)
+    df['price'] = (df['gross_amount'] / shares).abs().fillna(0.0)
+    df['wkn'] = df['wkn'].fillna('')
+    df['security_name'] = df['security_name'].fillna('')
+    df['date_text'] = format_german_dates(df['date'])
+    return df
+
+
+def _match_security(group: Tuple[np.ndarray, ...]) -> List[Tuple]:
+    """
+    FIFO-match the buys and sells of one security and return its result rows.
 
-def parse_german_decimal(value: str) -> Decimal:
-    """Convert German decimal format (47,53) to Decimal."""
-    if not value or value == '0':
-        return Decimal('0')
-    try:
-        # Replace comma with period for Decimal parsing
-        return Decimal(value.replace(',', '.'))
-    except (InvalidOperation, ValueError):
-        return Decimal('0')
-
-
-def parse_german_date(date_str: str) -> datetime:
-    """Parse German date format DD.MM.YYYY."""
-    return datetime.strptime(date_str, '%d.%m.%Y')
-
-
-def parse_shares(shares_str: str) -> Decimal:
-    """Parse share count, handling both integer and decimal values."""
-    try:
-        return parse_german_decimal(shares_str)
-    except:
-        return Decimal('0')
-
-
-class Transaction:
-    """Represents a single transaction (buy or sell)."""
-    def __init__(self, row: Dict[str, str]):
-        self.date = parse_german_date(row['Buchungstag'])
-        self.tax_date = parse_german_date(row['Steuerliches Datum'])
-        self.transaction_type = row['Vorgang']
-        
-        # Handle encoding issue with "Stück/Nominale" column
-        share_key = None
-        for key in row.keys():
-            if 'ck/Nominale' in key or 'Nominale' in key:
-                share_key = key
-                break
-        
-        self.shares = parse_shares(row[share_key]) if share_key else Decimal('0')
-        self.security_name = row['Bezeichnung']
-        self.wkn = row['WKN']
-        self.gross_amount = parse_german_decimal(row['Betrag Brutto'])
-        self.realized_pl = parse_german_decimal(row['Gewinn/Verlust'])
-        
-    def is_buy(self) -> bool:
-        """Check if this is a buy transaction."""
-        return self.transaction_type in ['Kauf', 'Kauf ausl.m.Ertragsant', 'Kauf inl. m.Ertragsant']
-    
-    def is_sell(self) -> bool:
-        """Check if this is a sell transaction."""
-        return self.transaction_type in ['Verkauf', 'Verkauf Investmentfonds']
-    
-    def get_price_per_share(self) -> Decimal:
-        """Calculate price per share (gross amount / shares)."""
-        if self.shares == 0:
-            return Decimal('0')
-        return abs(self.gross_amount / self.shares)
+    Takes plain arrays (buy shares/prices/dates, sell names/shares/prices/P&L/dates)
+    rather than DataFrame slices.
+    """
+    (buy_shares, buy_prices, buy_dates,
+     sell_names, sell_shares, sell_prices, sell_pl, sell_dates) = group
+    buy_idx, sell_idx, shares = fifo_match(buy_shares, sell_shares)
+    if len(sell_idx) == 0:
+        return []
+
+    # The sell's realized P/L already contains the total P/L from the CSV;
+    # split it proportionally across the matches
+    partial_pl = sell_pl[sell_idx] * (shares / sell_shares[sell_idx])
+
+    sell_prices = sell_prices[sell_idx]
+    unmatched = buy_idx < 0
+
+    # Calculate implied buy price for unmatched shares: sell_price - (pl / shares)
+    buy_prices = np.append(buy_prices, 0.0)[buy_idx]
+    buy_prices[unmatched] = sell_prices[unmatched] - partial_pl[unmatched] / shares[unmatched]
+    buy_dates = np.append(buy_dates, 'N/A (before data)')
+
+    return list(zip(
+        sell_names[sell_idx].tolist(),
+        buy_dates[buy_idx].tolist(),
+        buy_prices.tolist(),
+        np.round(shares, 6).tolist(),
+        sell_dates[sell_idx].tolist(),
+        sell_prices.tolist(),
+        np.round(partial_pl, 2).tolist(),
+    ))
 
 
 def analyze_csv(filepath: str) -> List[Tuple]:
@@ -80,141 +151,73 @@ def analyze_csv(filepath: str) -> List[Tuple]:
     buy_price will be calculated from (sell_price - realized_pl/shares).
     """
     
-    # Dictionary to track transactions by security (WKN)
-    # WKN is the German securities identifier
-    transactions_by_security = defaultdict(lambda: {'buys': [], 'sells': []})
-    
     # Read CSV with proper encoding
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f, delimiter=';')
-            
-            for row in reader:
-                try:
-                    trans = Transaction(row)
-                    
-                    # Only track actual buy/sell transactions
-                    if trans.is_buy():
-                        transactions_by_security[trans.wkn]['buys'].append(trans)
-                    elif trans.is_sell():
-                        transactions_by_security[trans.wkn]['sells'].append(trans)
-                        
-                except Exception as e:
-                    # Skip rows that can't be parsed
-                    continue
-                    
+        df = _read_transactions(filepath, 'utf-8')
     except UnicodeDecodeError:
         # Try Windows-1252 encoding if UTF-8 fails
-        with open(filepath, 'r', encoding='windows-1252') as f:
-            reader = csv.DictReader(f, delimiter=';')
-            
-            for row in reader:
-                try:
-                    trans = Transaction(row)
-                    
-                    if trans.is_buy():
-                        transactions_by_security[trans.wkn]['buys'].append(trans)
-                    elif trans.is_sell():
-                        transactions_by_security[trans.wkn]['sells'].append(trans)
-                        
-                except Exception as e:
-                    continue
+        df = _read_transactions(filepath, 'windows-1252')
     
     # Match buy/sell pairs using FIFO (First In, First Out)
-    results = []
-    
-    for wkn, trans_dict in transactions_by_security.items():
-        buys = sorted(trans_dict['buys'], key=lambda x: x.date)
-        sells = sorted(trans_dict['sells'], key=lambda x: x.date)
-        
-        if not sells:
+    # WKN is the German securities identifier
+    # Split buys and sells once for the whole file instead of masking every
+    # group; a stable date sort keeps the export order for same-day rows.
+    security_order = df['wkn'].unique()
+    df = df.sort_values('date', kind='stable')
+    all_buys = df[df['transaction_type'].isin(BUY_TYPES)]
+    all_sells = df[df['transaction_type'].isin(SELL_TYPES)]
+    buy_rows = all_buys.groupby('wkn', sort=False).indices
+    sell_rows = all_sells.groupby('wkn', sort=False).indices
+    no_rows = np.empty(0, dtype=np.int64)
+    
+    # Pull every column out as one array (struct of arrays) and slice those
+    # per security, instead of going through pandas for each group
+    buy_columns = (
+        all_buys['shares'].to_numpy(dtype=np.float64),
+        all_buys['price'].to_numpy(dtype=np.float64),
+        all_buys['date_text'].to_numpy(dtype=object),
+    )
+    sell_columns = (
+        all_sells['security_name'].to_numpy(dtype=object),
+        all_sells['shares'].abs().to_numpy(dtype=np.float64),
+        all_sells['price'].to_numpy(dtype=np.float64),
+        all_sells['realized_pl'].to_numpy(dtype=np.float64),
+        all_sells['date_text'].to_numpy(dtype=object),
+    )
+    
+    groups = []
+    for wkn in security_order:
+        if wkn not in sell_rows:
             # No sells for this security
             continue
-            
-        # For each sell, match with corresponding buys (FIFO)
-        for sell in sells:
-            if sell.shares == 0:
-                continue
-                
-            remaining_shares = abs(sell.shares)
-            sell_price_per_share = sell.get_price_per_share()
-            
-            # Track if we matched any buys
-            matched_any = False
-            
-            # Match with buys (FIFO)
-            for buy in buys:
-                if buy.shares == 0:
-                    continue
-                    
-                if remaining_shares <= 0:
-                    break
-                
-                matched_any = True
-                
-                # How many shares from this buy are we selling?
-                shares_to_match = min(remaining_shares, buy.shares)
-                buy_price_per_share = buy.get_price_per_share()
-                
-                # Calculate P/L for this portion
-                # Note: sell.realized_pl already contains the total P/L from the CSV
-                # We'll use it proportionally
-                proportion = shares_to_match / abs(sell.shares)
-                partial_pl = sell.realized_pl * proportion
-                
-                results.append((
-                    sell.security_name,
-                    buy.date.strftime('%d.%m.%Y'),
-                    buy_price_per_share,
-                    shares_to_match,
-                    sell.date.strftime('%d.%m.%Y'),
-                    sell_price_per_share,
-                    partial_pl
-                ))
-                
-                # Update remaining shares
-                buy.shares -= shares_to_match
-                remaining_shares -= shares_to_match
-            
-            # If we didn't match any buys, still report the sell
-            # Calculate implied buy price from P/L
-            if not matched_any or remaining_shares > 0:
-                shares_unmatched = abs(sell.shares) if not matched_any else remaining_shares
-                proportion = shares_unmatched / abs(sell.shares)
-                partial_pl = sell.realized_pl * proportion
-                
-                # Calculate implied buy price: sell_price - (pl / shares)
-                if shares_unmatched > 0:
-                    implied_buy_price = sell_price_per_share - (partial_pl / shares_unmatched)
-                else:
-                    implied_buy_price = Decimal('0')
-                
-                results.append((
-                    sell.security_name,
-                    'N/A (before data)',
-                    implied_buy_price,
-                    shares_unmatched,
-                    sell.date.strftime('%d.%m.%Y'),
-                    sell_price_per_share,
-                    partial_pl
-                ))
+        buys = buy_rows.get(wkn, no_rows)
+        sells = sell_rows[wkn]
+        groups.append(tuple(column[buys] for column in buy_columns)
+                      + tuple(column[sells] for column in sell_columns))
     
+    results = []
+    for group in groups:
+        results.extend(_match_security(group))
     return results
 
 
 def print_results(results: List[Tuple]):
     """Print results in a formatted table."""
-    print(f"\n{'Security':<40} {'Buy Date':<20} {'Buy Price':>12} {'Shares':>10} {'Sell Date':<12} {'Sell Price':>12} {'Realized P/L':>15}")
-    print("=" * 150)
+    # Collect the whole table and write it once instead of one print per row
+    lines = [
+        f"\n{'Security':<40} {'Buy Date':<20} {'Buy Price':>12} {'Shares':>10} {'Sell Date':<12} {'Sell Price':>12} {'Realized P/L':>15}",
+        "=" * 150,
+    ]
     
-    total_pl = Decimal('0')
+    total_pl = 0.0
     
     for security, buy_date, buy_price, shares, sell_date, sell_price, realized_pl in results:
-        print(f"{security:<40} {buy_date:<20} {buy_price:>12.2f} {shares:>10.2f} {sell_date:<12} {sell_price:>12.2f} {realized_pl:>15.2f}")
+        lines.append(f"{security:<40} {buy_date:<20} {buy_price:>12.2f} {shares:>10.2f} {sell_date:<12} {sell_price:>12.2f} {realized_pl:>15.2f}")
         total_pl += realized_pl
     
-    print("=" * 150)
-    print(f"{'Total Realized P/L:':<133} {total_pl:>15.2f}")
+    lines.append("=" * 150)
+    lines.append(f"{'Total Realized P/L:':<133} {total_pl:>15.2f}")
+    sys.stdout.write('\n'.join(lines) + '\n')
 
 
 def main():
@@ -236,12 +239,7 @@ def main():
     
     # Also save to CSV
     output_file = r'd:\src\portfolio_tracker\data\transaction_analysis.csv'
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['Security Name', 'Buy Date', 'Buy Price', 'Share Count', 'Sell Date', 'Sell Price', 'Realized P/L'])
-        
-        for row in results:
-            writer.writerow(row)
+    write_results_csv(output_file, ['Security Name', 'Buy Date', 'Buy Price', 'Share Count', 'Sell Date', 'Sell Price', 'Realized P/L'], results)
     
     print(f"\nResults saved to: {output_file}")
 
@@ -5,12 +5,14 @@ from __future__ import annotations
 
 import argparse
 import csv
+import mmap
 import re
 import sys
 from dataclasses import dataclass
 from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Iterable, Iterator, List, Optional
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
@@ -22,12 +24,14 @@ ENTRY_HEADER = "Wert:"
 DATE_IN_LINE_RE = re.compile(r"(\d{2}\.\d{2}\.\d{4})")
 BROKER_NAME = "comdirect"
 SHARE_LINE_RE = re.compile(r"^\s*([\d\.\s]+)\s+(.+?)\s+<", re.IGNORECASE)
-CURRENCY_RE = re.compile(r"^[A-Z]{3}$")
-PRICE_TOKEN_RE = re.compile(r"^[\d\.,]+%?$")
+# "<CUR> <at least two tokens> <CUR> <price>" in one pass, e.g. "EUR XETRA ... EUR 12,34"
+PRICE_LINE_RE = re.compile(r"^\s*[A-Z]{3}(?:\s+\S+){2,}\s+[A-Z]{3}\s+([\d\.,]+%?)\s*$")
+# Write buffer for the normalized CSV; amortizes syscalls on large exports
+IO_BUFFER_SIZE = 1 << 20
 FIELDNAMES = ["broker", "security_name", "shares", "share_price", "amount", "date"]
 
 
-@dataclass
+@dataclass(slots=True)
 class PositionState:
     """Holds intermediate parsing state for a single position."""
 
@@ -40,6 +44,7 @@ class PositionState:
     date: Optional[str] = None
 
 
+@lru_cache(maxsize=2048)
 def count_decimal_places(value: str) -> int:
     cleaned = value.strip().rstrip("%")
     if "," in cleaned:
@@ -52,9 +57,15 @@ def decimal_places_from_decimal(value: Decimal) -> int:
 
 
 def decimal_to_german(value: Decimal, decimals: int) -> str:
+    # Keyed on the exact string so e.g. -0 and 0 don't share a cache entry
+    return _decimal_to_german_cached(str(value), decimals)
+
+
+@lru_cache(maxsize=2048)
+def _decimal_to_german_cached(value_str: str, decimals: int) -> str:
     decimals = max(decimals, 0)
     quant = Decimal("1") if decimals == 0 else Decimal(f"1.{'0' * decimals}")
-    normalized = value.quantize(quant, rounding=ROUND_HALF_UP)
+    normalized = Decimal(value_str).quantize(quant, rounding=ROUND_HALF_UP)
     return format(normalized, "f").replace(".", ",")
 
 
@@ -76,18 +87,10 @@ def extract_share_line(line: str) -> Optional[tuple[str, str]]:
 
 
 def extract_price(line: str) -> Optional[tuple[Decimal, int]]:
-    collapsed = " ".join(line.replace("\t", " ").split())
-    if not collapsed:
-        return None
-    tokens = collapsed.split(" ")
-    if len(tokens) < 5:
-        return None
-    if not (CURRENCY_RE.fullmatch(tokens[0]) and CURRENCY_RE.fullmatch(tokens[-2])):
-        return None
-    candidate = tokens[-1]
-    if not PRICE_TOKEN_RE.fullmatch(candidate):
+    match = PRICE_LINE_RE.match(line)
+    if not match:
         return None
-    numeric = candidate.rstrip("%")
+    numeric = match.group(1).rstrip("%")
     decimals = count_decimal_places(numeric)
     value = parse_german_decimal(numeric)
     if value is None:
@@ -191,9 +194,22 @@ def parse_open_positions(lines: Iterable[str]) -> List[dict[str, str]]:
     return entries
 
 
+def iter_lines(input_path: Path) -> Iterator[str]:
+    """Yield decoded lines from a memory-mapped file without loading it whole."""
+    if input_path.stat().st_size == 0:
+        return
+    with input_path.open("rb") as handle, mmap.mmap(
+        handle.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        for line in iter(mapped.readline, b""):
+            yield line.decode("utf-8").rstrip("\r\n")
+
+
 def write_csv(entries: List[dict[str, str]], output_path: Path) -> None:
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    with output_path.open("w", newline="", encoding="utf-8") as csvfile:
+    with output_path.open(
+        "w", newline="", encoding="utf-8", buffering=IO_BUFFER_SIZE
+    ) as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES, delimiter=";")
         writer.writeheader()
         for entry in entries:
@@ -221,8 +237,7 @@ def main() -> None:
     input_path = Path(args.input)
     if not input_path.exists():
         raise FileNotFoundError(f"Input file not found: {input_path}")
-    lines = input_path.read_text(encoding="utf-8").splitlines()
-    entries = parse_open_positions(lines)
+    entries = parse_open_positions(iter_lines(input_path))
     if not entries:
         print("No positions detected; nothing to write.")
         return
@@ -7,14 +7,26 @@ and computes CAGR based on total returns.
 """
 
 import csv
+import sys
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Tuple
-from collections import defaultdict
 
+import numpy as np
+import pandas as pd
 
+
+@lru_cache(maxsize=None)
 def parse_german_date(date_str: str) -> datetime:
     """Parse German date format DD.MM.YYYY."""
+    # Slicing the fixed-width form skips strptime's format interpretation;
+    # anything else still goes through strptime (and its error reporting)
+    if len(date_str) == 10 and date_str[2] == '.' and date_str[5] == '.':
+        return datetime(int(date_str[6:]), int(date_str[3:5]), int(date_str[:2]))
     return datetime.strptime(date_str, '%d.%m.%Y')
 
 
@@ -43,6 +55,41 @@ def calculate_cagr(initial_value: float, final_value: float, years: float) -> fl
     return cagr
 
 
+def calculate_cagr_columns(
+    initial_value: pd.Series,
+    final_value: pd.Series,
+    years: pd.Series
+) -> np.ndarray:
+    """Vectorized calculate_cagr over whole columns (same cases, same results)."""
+    initial = initial_value.to_numpy(dtype=np.float64)
+    final = final_value.to_numpy(dtype=np.float64)
+    years = years.to_numpy(dtype=np.float64)
+    valid = (initial > 0) & (years > 0)
+    gains = valid & (final > 0)
+    losses = valid & (final <= 0)
+    
+    # Both branches grow the same ratio (|final| equals final for gains), so
+    # a single in-place power over the valid rows serves both
+    ratio = np.abs(final[valid]) / initial[valid]
+    with np.errstate(over='ignore'):
+        np.power(ratio, 1 / years[valid], out=ratio)
+    growth = np.zeros_like(initial)
+    growth[valid] = ratio
+    
+    cagr = np.zeros_like(initial)
+    cagr[gains] = (growth[gains] - 1) * 100
+    cagr[losses] = -100.0 * (1 - growth[losses])
+    return cagr
+
+
+def _to_float_column(values: pd.Series) -> pd.Series:
+    """Return values as float64, accepting a decimal comma in text columns."""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(np.float64)
+    # Only columns the C parser could not read as numbers take this path
+    return values.astype(str).str.replace(',', '.', regex=False).astype(np.float64)
+
+
 def load_dividends(dividends_file: Path) -> List[Dict[str, str]]:
     """Load dividend data from CSV."""
     dividends = []
@@ -67,144 +114,147 @@ def aggregate_transactions(
     # Load dividends
     dividends = load_dividends(dividends_file)
     
-    # Track which dividends have been matched
-    matched_dividend_indices = set()
-    
-    # Aggregate transactions by (security, buy_date, sell_date)
-    aggregated: Dict[Tuple[str, str, str], Dict] = defaultdict(lambda: {
-        'invested_value': 0.0,
-        'realized_pl': 0.0,
-        'buy_date': '',
-        'sell_date': '',
-        'security_name': '',
-        'share_count': 0.0
-    })
+    # Track which dividends have been matched (one flag byte per dividend)
+    matched_dividends = bytearray(len(dividends))
     
-    with open(transactions_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            security_name = row['Security Name'].strip()
-            buy_date = row['Buy Date'].strip()
-            sell_date = row['Sell Date'].strip()
-            invested_value = float(row['Invested Value'].replace(',', '.'))
-            realized_pl = float(row['Realized P/L'].replace(',', '.'))
-            share_count = float(row['Share Count'].replace(',', '.'))
-            
-            key = (security_name, buy_date, sell_date)
-            
-            aggregated[key]['security_name'] = security_name
-            aggregated[key]['buy_date'] = buy_date
-            aggregated[key]['sell_date'] = sell_date
-            aggregated[key]['invested_value'] += invested_value
-            aggregated[key]['realized_pl'] += realized_pl
-            aggregated[key]['share_count'] += share_count
-    
-    # Calculate dividends and CAGR for each aggregated position
-    results = []
-    
-    for key, data in aggregated.items():
-        security_name = data['security_name']
-        buy_date_str = data['buy_date']
-        sell_date_str = data['sell_date']
-        invested_value = data['invested_value']
-        realized_pl = data['realized_pl']
-        position_share_count = data['share_count']
+    # Aggregate transactions by (security, buy_date, sell_date) in one groupby;
+    # sort=False keeps the order in which positions first appear in the file
+    key_columns = ['Security Name', 'Buy Date', 'Sell Date']
+    value_columns = ['Invested Value', 'Realized P/L', 'Share Count']
+    # Only the key columns are forced to text; the C parser converts the value
+    # columns to float64 directly
+    transactions = pd.read_csv(
+        transactions_file,
+        encoding='utf-8',
+        dtype={column: str for column in key_columns},
+        keep_default_na=False,
+    )
+    for column in key_columns:
+        transactions[column] = transactions[column].str.strip()
+    for column in value_columns:
+        transactions[column] = _to_float_column(transactions[column])
+    aggregated = transactions.groupby(key_columns, sort=False, as_index=False)[value_columns].sum()
+    
+    # Parse each date column once
+    buy_dates = pd.to_datetime(aggregated['Buy Date'], format='%d.%m.%Y')
+    sell_dates = pd.to_datetime(aggregated['Sell Date'], format='%d.%m.%Y')
+    
+    # Bucket dividends by security once, with dates and amounts pre-parsed and
+    # each bucket sorted by date, so a position only bisects its own bucket
+    # instead of scanning (and re-parsing) every dividend.
+    position_securities = set(aggregated['Security Name'].tolist())
+    dividends_by_security: Dict[str, List[Tuple[datetime, int, float, float]]] = defaultdict(list)
+    for idx, div in enumerate(dividends):
+        div_amount = float(div['Dividend amount'])
+        div_security = div['Security name'].strip()
+        if div_security not in position_securities:
+            continue
+        div_share_count_str = div.get('Share count', '').strip()
         
-        # Parse dates
-        buy_date = parse_german_date(buy_date_str)
-        sell_date = parse_german_date(sell_date_str)
+        # Parse dividend share count
+        try:
+            div_share_count = float(div_share_count_str) if div_share_count_str else 0.0
+        except ValueError:
+            div_share_count = 0.0
         
-        # Calculate total dividends received during holding period
+        div_date = parse_german_date(div['Date'].strip())
+        dividends_by_security[div_security].append((div_date, idx, div_amount, div_share_count))
+    for bucket in dividends_by_security.values():
+        bucket.sort()
+    bucket_dates = {
+        security: [entry[0] for entry in bucket]
+        for security, bucket in dividends_by_security.items()
+    }
+    
+    # Calculate total dividends received during each holding period
+    total_dividends = []
+    dividend_counts = []
+    
+    for security_name, position_share_count, buy_date, sell_date in zip(
+        aggregated['Security Name'].tolist(),
+        aggregated['Share Count'].tolist(),
+        buy_dates.dt.to_pydatetime().tolist(),
+        sell_dates.dt.to_pydatetime().tolist(),
+    ):
         # Match by security name and date range, apply pro-rata based on share count
         total_dividend = 0.0
         dividend_count = 0
         
-        for idx, div in enumerate(dividends):
-            # Skip if already matched
-            if idx in matched_dividend_indices:
-                continue
+        bucket = dividends_by_security.get(security_name)
+        if bucket:
+            # Dividend dates within the holding period (inclusive); summed in
+            # file order so the totals don't depend on the bucket ordering
+            dates = bucket_dates[security_name]
+            window = bucket[bisect_left(dates, buy_date):bisect_right(dates, sell_date)]
+            for div_date, idx, div_amount, div_share_count in sorted(window, key=itemgetter(1)):
+                # Skip if already matched
+                if matched_dividends[idx]:
+                    continue
                 
-            div_security = div['Security name'].strip()
-            div_date_str = div['Date'].strip()
-            div_amount = float(div['Dividend amount'])
-            div_share_count_str = div.get('Share count', '').strip()
-            
-            # Parse dividend share count
-            try:
-                div_share_count = float(div_share_count_str) if div_share_count_str else 0.0
-            except ValueError:
-                div_share_count = 0.0
-            
-            # Check if security matches (ignore share count for matching)
-            if div_security == security_name:
-                div_date = parse_german_date(div_date_str)
-                # Check if dividend date is within holding period (inclusive)
-                if buy_date <= div_date <= sell_date:
-                    # Calculate pro-rata dividend based on share count ratio
-                    if div_share_count > 0 and position_share_count > 0:
-                        # Pro-rata: (position shares / dividend shares) * dividend amount
-                        prorata_dividend = (position_share_count / div_share_count) * div_amount
-                    else:
-                        # If share counts not available, use full amount
-                        prorata_dividend = div_amount
-                    
-                    total_dividend += prorata_dividend
-                    dividend_count += 1
-                    matched_dividend_indices.add(idx)  # Mark as matched, use only once
-        
-        # Calculate holding period in years
-        holding_days = (sell_date - buy_date).days
-        holding_years = holding_days / 365.25
-        
-        # Calculate CAGR
-        # Final value = Initial investment + P/L + Dividends
-        total_return = realized_pl + total_dividend
-        final_value = invested_value + total_return
-        
-        cagr = calculate_cagr(invested_value, final_value, holding_years)
+                # Calculate pro-rata dividend based on share count ratio
+                if div_share_count > 0 and position_share_count > 0:
+                    # Pro-rata: (position shares / dividend shares) * dividend amount
+                    prorata_dividend = (position_share_count / div_share_count) * div_amount
+                else:
+                    # If share counts not available, use full amount
+                    prorata_dividend = div_amount
+                
+                total_dividend += prorata_dividend
+                dividend_count += 1
+                matched_dividends[idx] = 1  # Mark as matched, use only once
         
-        results.append({
-            'Security name': security_name,
-            'Share count': f'{position_share_count:.0f}',
-            'Invested_value': f'{invested_value:.2f}',
-            'BUY Date': buy_date_str,
-            'Sell Date': sell_date_str,
-            'P/L': f'{realized_pl:.2f}',
-            'Total dividend': f'{total_dividend:.2f}',
-            'Dividend count': dividend_count,
-            'CAGR (%)': f'{cagr:.2f}'
-        })
-    
-    # Sort by security name, then by buy date
-    results.sort(key=lambda x: (x['Security name'], parse_german_date(x['BUY Date'])))
+        total_dividends.append(total_dividend)
+        dividend_counts.append(dividend_count)
+    
+    aggregated['Total Dividend'] = total_dividends
+    aggregated['Dividend Count'] = dividend_counts
+    
+    # Holding period in years and CAGR, vectorized over all positions
+    # Final value = Initial investment + P/L + Dividends
+    holding_years = (sell_dates - buy_dates).dt.days / 365.25
+    total_return = aggregated['Realized P/L'] + aggregated['Total Dividend']
+    final_value = aggregated['Invested Value'] + total_return
+    cagr = calculate_cagr_columns(aggregated['Invested Value'], final_value, holding_years)
+    
+    results = pd.DataFrame({
+        'Security name': aggregated['Security Name'],
+        'Share count': [f'{value:.0f}' for value in aggregated['Share Count'].tolist()],
+        'Invested_value': [f'{value:.2f}' for value in aggregated['Invested Value'].tolist()],
+        'BUY Date': aggregated['Buy Date'],
+        'Sell Date': aggregated['Sell Date'],
+        'P/L': [f'{value:.2f}' for value in aggregated['Realized P/L'].tolist()],
+        'Total dividend': [f'{value:.2f}' for value in total_dividends],
+        'Dividend count': dividend_counts,
+        'CAGR (%)': [f'{value:.2f}' for value in cagr.tolist()],
+    })
+    
+    # Sort by security name, then by buy date, reusing the dates parsed above
+    # as sort keys rather than parsing 'BUY Date' again (np.lexsort is stable)
+    order = np.lexsort((buy_dates.to_numpy(), results['Security name'].to_numpy(dtype=object)))
+    results = results.iloc[order]
     
     # Print unmatched dividends
-    unmatched_dividends = []
-    for idx, div in enumerate(dividends):
-        if idx not in matched_dividend_indices:
-            unmatched_dividends.append(div)
+    unmatched_dividends = [div for idx, div in enumerate(dividends) if not matched_dividends[idx]]
     
     if unmatched_dividends:
         print("\n" + "="*80)
         print(f"UNMATCHED DIVIDENDS: {len(unmatched_dividends)} dividends not matched to positions")
         print("="*80)
-        for div in unmatched_dividends:
-            print(f"  {div['Date']} | {div['Security name']:40s} | "
-                  f"Shares: {div.get('Share count', 'N/A'):>8s} | "
-                  f"Amount: {div['Dividend amount']:>10s}")
+        # Build the listing once and emit it in a single write
+        lines = [
+            f"  {div['Date']} | {div['Security name']:40s} | "
+            f"Shares: {div.get('Share count', 'N/A'):>8s} | "
+            f"Amount: {div['Dividend amount']:>10s}"
+            for div in unmatched_dividends
+        ]
+        sys.stdout.write('\n'.join(lines) + '\n')
         print("="*80 + "\n")
     
-    # Write output
-    with open(output_file, 'w', encoding='utf-8', newline='') as f:
-        fieldnames = ['Security name', 'Share count', 'Invested_value', 'BUY Date', 'Sell Date', 
-                      'P/L', 'Total dividend', 'Dividend count', 'CAGR (%)']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        writer.writerows(results)
+    # Write output (csv.DictWriter-compatible line endings)
+    results.to_csv(output_file, index=False, encoding='utf-8', lineterminator='\r\n')
     
     print(f"Created aggregated report with {len(results)} positions")
-    print(f"Matched {len(matched_dividend_indices)} dividends to positions")
+    print(f"Matched {matched_dividends.count(1)} dividends to positions")
     print(f"Output written to: {output_file}")
 
 
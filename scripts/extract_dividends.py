@@ -11,8 +11,33 @@ Output columns: Date, Security name, Dividend amount
 """
 
 import csv
+import re
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Optional, Tuple
+
+# Keywords to identify dividend transactions, matched in one regex pass
+DIVIDEND_RE = re.compile(r'Zinsen|Dividenden|Divid\.|Ausschüttung')
+
+
+def _column_index(header: List[str], name: str) -> Optional[int]:
+    """Position of a header column, or None when the export lacks it."""
+    return header.index(name) if name in header else None
+
+
+def _cell(row: List[str], index: Optional[int]) -> str:
+    """Cell at index, or '' for missing columns and short rows."""
+    if index is None or index >= len(row):
+        return ''
+    return row[index]
+
+
+def _clean(value: str) -> str:
+    """strip() and then strip('"'), skipping the second pass for unquoted fields."""
+    value = value.strip()
+    # csv.reader already removed proper quoting; only stray quotes remain here
+    if value and (value[0] == '"' or value[-1] == '"'):
+        return value.strip('"')
+    return value
 
 
 def extract_dividends(input_file: Path, output_file: Path) -> None:
@@ -23,47 +48,53 @@ def extract_dividends(input_file: Path, output_file: Path) -> None:
         input_file: Path to input CSV file
         output_file: Path to output CSV file
     """
-    # Keywords to identify dividend transactions
-    dividend_keywords = ['Zinsen', 'Dividenden', 'Divid.', 'Ausschüttung']
-    
-    dividends: List[Dict[str, str]] = []
+    dividends: List[Tuple[str, str, str, str]] = []
     
     # Read input CSV with semicolon delimiter and Windows-1252 encoding
     with open(input_file, 'r', encoding='windows-1252') as f:
-        reader = csv.DictReader(f, delimiter=';')
+        reader = csv.reader(f, delimiter=';')
+        header = next(reader, [])
+        
+        # Resolve column positions once from the header row
+        idx_vorgang = _column_index(header, 'Vorgang')
+        idx_buchungstag = _column_index(header, 'Buchungstag')
+        idx_bezeichnung = _column_index(header, 'Bezeichnung')
+        idx_betrag_brutto = _column_index(header, 'Betrag Brutto')
+        # Try different possible column names for share count due to encoding
+        idx_share_counts = [
+            index for index in (
+                _column_index(header, 'Stück/Nominale'),
+                _column_index(header, 'St\ufffdck/Nominale'),
+            )
+            if index is not None
+        ]
         
         for row in reader:
-            vorgang = row.get('Vorgang', '').strip()
+            vorgang = _cell(row, idx_vorgang).strip()
             
             # Check if transaction type contains any dividend keyword
-            if any(keyword in vorgang for keyword in dividend_keywords):
+            if DIVIDEND_RE.search(vorgang):
                 # Extract relevant fields
-                buchungstag = row.get('Buchungstag', '').strip().strip('"')
-                bezeichnung = row.get('Bezeichnung', '').strip().strip('"')
-                betrag_brutto = row.get('Betrag Brutto', '').strip().strip('"')
+                buchungstag = _clean(_cell(row, idx_buchungstag))
+                bezeichnung = _clean(_cell(row, idx_bezeichnung))
+                betrag_brutto = _clean(_cell(row, idx_betrag_brutto))
                 
-                # Try different possible column names for share count due to encoding
-                share_count = row.get('Stück/Nominale', '').strip().strip('"')
-                if not share_count:
-                    share_count = row.get('St�ck/Nominale', '').strip().strip('"')
+                share_count = ''
+                for index in idx_share_counts:
+                    share_count = _clean(_cell(row, index))
+                    if share_count:
+                        break
                 
                 # Convert German decimal format (comma) to standard format (dot)
                 betrag_brutto = betrag_brutto.replace(',', '.')
                 share_count = share_count.replace(',', '.')
                 
-                dividends.append({
-                    'Date': buchungstag,
-                    'Security name': bezeichnung,
-                    'Share count': share_count,
-                    'Dividend amount': betrag_brutto
-                })
+                dividends.append((buchungstag, bezeichnung, share_count, betrag_brutto))
     
     # Write output CSV
     with open(output_file, 'w', encoding='utf-8', newline='') as f:
-        fieldnames = ['Date', 'Security name', 'Share count', 'Dividend amount']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        
-        writer.writeheader()
+        writer = csv.writer(f)
+        writer.writerow(['Date', 'Security name', 'Share count', 'Dividend amount'])
         writer.writerows(dividends)
     
     print(f"Extracted {len(dividends)} dividend transactions")
@@ -6,10 +6,19 @@ and outputs only dividends for securities that have buy transactions
 (with available buy date and price) in the transaction analysis.
 """
 
-import csv
 from pathlib import Path
 from typing import Set
 
+import pandas as pd
+
+TRANSACTION_COLUMNS = ['Security Name', 'Buy Date', 'Buy Price']
+DIVIDEND_FIELDNAMES = ['Date', 'Security name', 'Share count', 'Dividend amount']
+
+
+def _read_text_csv(filepath: Path, usecols=None) -> pd.DataFrame:
+    """Read a CSV with every cell as text; blank cells stay empty strings."""
+    return pd.read_csv(filepath, encoding='utf-8', dtype=str, keep_default_na=False, usecols=usecols)
+
 
 def filter_dividends_with_purchases(
     dividends_file: Path,
@@ -25,42 +34,33 @@ def filter_dividends_with_purchases(
         output_file: Path to output filtered CSV
     """
     # Read securities with BUY transactions from transaction analysis
-    securities_with_purchases: Set[str] = set()
+    transactions = _read_text_csv(transactions_file, usecols=lambda c: c in TRANSACTION_COLUMNS)
+    transactions = transactions.reindex(columns=TRANSACTION_COLUMNS, fill_value='')
+    stripped = {column: transactions[column].str.strip() for column in TRANSACTION_COLUMNS}
     
-    with open(transactions_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            security_name = row.get('Security Name', '').strip()
-            buy_date = row.get('Buy Date', '').strip()
-            buy_price = row.get('Buy Price', '').strip()
-            
-            # Only include if buy date and price are available
-            if security_name and buy_date and buy_price:
-                securities_with_purchases.add(security_name)
+    # Only include if buy date and price are available
+    has_purchase = (
+        (stripped['Security Name'] != '')
+        & (stripped['Buy Date'] != '')
+        & (stripped['Buy Price'] != '')
+    )
+    securities_with_purchases: Set[str] = set(stripped['Security Name'][has_purchase])
     
     print(f"Found {len(securities_with_purchases)} unique securities with BUY transactions")
     
-    # Filter dividends
-    filtered_dividends = []
-    total_dividends = 0
-    
-    with open(dividends_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            total_dividends += 1
-            security_name = row.get('Security name', '').strip()
-            
-            # Check if this security has purchase history
-            if security_name in securities_with_purchases:
-                filtered_dividends.append(row)
+    # Filter dividends with a vectorized hash lookup on the security name
+    dividends = _read_text_csv(dividends_file)
+    total_dividends = len(dividends)
+    if 'Security name' in dividends.columns:
+        security_names = dividends['Security name'].str.strip()
+    else:
+        security_names = pd.Series('', index=dividends.index)
+    filtered_dividends = dividends[security_names.isin(securities_with_purchases)]
     
-    # Write filtered output
-    with open(output_file, 'w', encoding='utf-8', newline='') as f:
-        fieldnames = ['Date', 'Security name', 'Share count', 'Dividend amount']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        writer.writerows(filtered_dividends)
+    # Write filtered output (csv.DictWriter-compatible line endings)
+    filtered_dividends.reindex(columns=DIVIDEND_FIELDNAMES, fill_value='').to_csv(
+        output_file, index=False, encoding='utf-8', lineterminator='\r\n'
+    )
     
     print(f"Total dividends: {total_dividends}")
     print(f"Filtered dividends (with purchases): {len(filtered_dividends)}")
@@ -0,0 +1,111 @@
+"""
+Load every recognised broker export in a directory into the staging tables.
+
+Each file is handed to its loader in a separate worker process, so parsing
+runs in parallel; the loaders write to disjoint staging tables and only
+serialize on SQLite's write lock while inserting.
+
+Usage:
+    python scripts/load_all.py [<directory>] [--db <path>]
+
+Example:
+    python scripts/load_all.py data/input
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatch
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from configuration import DB_PATH, LOADER_LOG_PATH
+from load_comdirect_tax_detail import load_comdirect_tax_detail
+from load_comdirect_transactions import load_comdirect_transactions
+from load_open_positions import load_open_positions
+from load_traderepublic_transactions import load_traderepublic_transactions
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler(LOADER_LOG_PATH),
+        logging.StreamHandler(),
+    ],
+)
+logger = logging.getLogger(__name__)
+
+# File name pattern -> loader, in the order the exports are usually produced
+LOADERS = (
+    ("abrechnungsdaten*.csv", load_comdirect_transactions),
+    ("steuerlichedetailansichtexport*.csv", load_comdirect_tax_detail),
+    ("traderepublic*.csv", load_traderepublic_transactions),
+    ("open_positions*.csv", load_open_positions),
+)
+
+
+def find_exports(directory: Path) -> list[tuple[Path, object]]:
+    """Pair each recognised export in directory with its loader."""
+    jobs = []
+    for path in sorted(directory.iterdir()):
+        if not path.is_file():
+            continue
+        for pattern, loader in LOADERS:
+            if fnmatch(path.name.lower(), pattern):
+                jobs.append((path, loader))
+                break
+    return jobs
+
+
+def _run_loader(loader, filepath: str, db_path: str) -> None:
+    loader(filepath, db_path)
+
+
+def load_all(directory: str, db_path: str | None = None) -> bool:
+    """Load all recognised exports in parallel; returns False if any loader failed."""
+    if db_path is None:
+        db_path = str(DB_PATH)
+
+    jobs = find_exports(Path(directory))
+    if not jobs:
+        logger.warning("No broker exports found in %s", directory)
+        return True
+
+    ok = True
+    workers = min(len(jobs), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (path, executor.submit(_run_loader, loader, str(path), db_path))
+            for path, loader in jobs
+        ]
+        for path, future in futures:
+            try:
+                future.result()
+            except (Exception, SystemExit) as exc:  # loaders exit on bad input
+                logger.error("Failed to load %s: %s", path.name, exc)
+                ok = False
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default="data/input",
+        help="Directory containing the broker exports (default: data/input)",
+    )
+    parser.add_argument("--db", default=None, help=f"Path to SQLite database (default: {DB_PATH})")
+    args = parser.parse_args()
+
+    if not load_all(args.directory, args.db):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,27 +2,34 @@
 Load Comdirect tax detail export (steuerlichedetailansichtexport) into staging table.
 
 Usage:
-    python scripts/load_comdirect_tax_detail.py <filepath>
+    python scripts/load_comdirect_tax_detail.py <filepath> [<filepath> ...]
 
 Example:
     python scripts/load_comdirect_tax_detail.py data/input/steuerlichedetailansichtexport_9772900462_20251205-1606.csv
 """
 
 import argparse
-import csv
 import logging
+import os
 import re
-import sqlite3
 import sys
 import unicodedata
-from decimal import Decimal
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import pandas as pd
+
 # Add parent directory to path to import configuration
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from configuration import DB_PATH, LOADER_LOG_PATH
-from src.utils.parse import parse_german_decimal, parse_german_date
+from src.repository.connection import connect_staging_db
 from src.repository.create_db import create_comdirect_tax_detail_staging
+from src.utils.loader import (
+    append_records,
+    parse_date_column,
+    parse_decimal_column,
+    read_german_csv,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -47,136 +54,129 @@ def _normalize_header(header: str) -> str:
     return normalized
 
 
-def _parse_int(value: str) -> int | None:
+def _parse_int_column(values: pd.Series) -> pd.Series:
     """Parse integer values, ignoring thousands separators."""
-    if not value or value.strip() == "":
-        return None
-    cleaned = value.replace('.', '').replace(',', '').strip()
-    try:
-        return int(cleaned)
-    except ValueError:
-        return None
+    cleaned = values.str.replace('.', '', regex=False).str.replace(',', '', regex=False).str.strip()
+    return pd.to_numeric(cleaned, errors='coerce').astype('Int64')
 
 
-def _parse_text(value: str) -> str | None:
-    return value.strip() if value and value.strip() != "" else None
+def _parse_text_column(values: pd.Series) -> pd.Series:
+    stripped = values.str.strip()
+    return stripped.astype(object).where(stripped.notna() & (stripped != ''), None)
 
 
 FIELD_DEFINITIONS = {
-    'steuerjahr': ('steuerjahr', _parse_int),
-    'buchungstag': ('buchungstag', parse_german_date),
-    'steuerlichesdatum': ('steuerliches_datum', parse_german_date),
-    'referenznummer': ('referenznummer', _parse_text),
-    'vorgang': ('vorgang', _parse_text),
-    'stucknominale': ('stueck_nominale', parse_german_decimal),
-    'bezeichnung': ('bezeichnung', _parse_text),
-    'wkn': ('wkn', _parse_text),
-    'betragbrutto': ('betrag_brutto', parse_german_decimal),
-    'gewinnverlust': ('gewinn_verlust', parse_german_decimal),
-    'gewinnaktien': ('gewinn_aktien', parse_german_decimal),
-    'verlustaktien': ('verlust_aktien', parse_german_decimal),
-    'gewinnsonstige': ('gewinn_sonstige', parse_german_decimal),
-    'verlustsonstige': ('verlust_sonstige', parse_german_decimal),
+    'steuerjahr': ('steuerjahr', _parse_int_column),
+    'buchungstag': ('buchungstag', parse_date_column),
+    'steuerlichesdatum': ('steuerliches_datum', parse_date_column),
+    'referenznummer': ('referenznummer', _parse_text_column),
+    'vorgang': ('vorgang', _parse_text_column),
+    'stucknominale': ('stueck_nominale', parse_decimal_column),
+    'bezeichnung': ('bezeichnung', _parse_text_column),
+    'wkn': ('wkn', _parse_text_column),
+    'betragbrutto': ('betrag_brutto', parse_decimal_column),
+    'gewinnverlust': ('gewinn_verlust', parse_decimal_column),
+    'gewinnaktien': ('gewinn_aktien', parse_decimal_column),
+    'verlustaktien': ('verlust_aktien', parse_decimal_column),
+    'gewinnsonstige': ('gewinn_sonstige', parse_decimal_column),
+    'verlustsonstige': ('verlust_sonstige', parse_decimal_column),
 }
 
+def parse_comdirect_tax_detail(filepath: str) -> pd.DataFrame | None:
+    """Parse one export into staging columns; None if no supported encoding fits."""
+    # Try different encodings
+    encodings = ['windows-1252', 'utf-8', 'latin-1']
+
+    # Parse CSV in one vectorized pass straight from the file; every cell
+    # stays text until its column parser converts it
+    raw = read_german_csv(filepath, encodings, use_pyarrow=True)
+    if raw is None:
+        return None
+
+    # Map raw headers to staging columns once; a later duplicate header wins
+    records = pd.DataFrame(index=raw.index)
+    for index, header in enumerate(raw.columns):
+        field_info = FIELD_DEFINITIONS.get(_normalize_header(header))
+        if not field_info:
+            continue
+        column_name, parser = field_info
+        records[column_name] = parser(raw.iloc[:, index])
+    records['source_file'] = Path(filepath).name
+    return records
+
+
+def _parse_all(filepaths: list[str]) -> list[pd.DataFrame | None]:
+    """Parse the exports, one worker process per file when there are several."""
+    workers = min(len(filepaths), os.cpu_count() or 1)
+    if workers < 2:
+        return [parse_comdirect_tax_detail(filepath) for filepath in filepaths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(parse_comdirect_tax_detail, filepaths))
+
 
 def load_comdirect_tax_detail(filepath: str, db_path: str = None):
     """Load Comdirect tax detail CSV into staging table."""
+    load_comdirect_tax_details([filepath], db_path)
+
+
+def load_comdirect_tax_details(filepaths: list[str], db_path: str = None):
+    """Load several Comdirect tax detail CSVs, parsing them in parallel."""
     if db_path is None:
         db_path = str(DB_PATH)
     
-    filepath_obj = Path(filepath)
-    if not filepath_obj.exists():
-        logger.error(f"File not found: {filepath}")
-        print(f"Error: File not found: {filepath}", file=sys.stderr)
-        sys.exit(1)
+    for filepath in filepaths:
+        if not Path(filepath).exists():
+            logger.error(f"File not found: {filepath}")
+            print(f"Error: File not found: {filepath}", file=sys.stderr)
+            sys.exit(1)
+
+    for filepath in filepaths:
+        logger.info(f"Starting import of Comdirect tax detail file: {Path(filepath).name}")
 
-    logger.info(f"Starting import of Comdirect tax detail file: {filepath_obj.name}")
+    # Parsing is CPU-bound and independent per file; the inserts below stay
+    # in this process because SQLite allows a single writer
+    parsed = _parse_all(filepaths)
 
     # Connect to database
-    conn = sqlite3.connect(db_path)
+    conn = connect_staging_db(db_path)
     cursor = conn.cursor()
 
     # Create staging table if it doesn't exist
     create_comdirect_tax_detail_staging(cursor)
 
-    # Read and import CSV
-    records_imported = 0
-
-    # Try different encodings
-    encodings = ['windows-1252', 'utf-8', 'latin-1']
-    csv_data = None
-    
-    for encoding in encodings:
-        try:
-            with open(filepath, 'r', encoding=encoding) as f:
-                csv_data = f.read()
-            break
-        except UnicodeDecodeError:
-            continue
-    
-    if csv_data is None:
-        error_msg = "Could not read file with any supported encoding"
-        logger.error(f"{error_msg}: {filepath}")
-        print(f"Error: {error_msg}", file=sys.stderr)
-        sys.exit(1)
-
-    # Parse CSV
-    reader = csv.DictReader(csv_data.splitlines(), delimiter=';')
-
     cursor.execute("PRAGMA table_info(comdirect_tax_detail_staging)")
     table_columns = {row[1] for row in cursor.fetchall()}
 
-    for row in reader:
-        record = {}
+    for filepath, records in zip(filepaths, parsed):
+        if records is None:
+            conn.close()
+            error_msg = "Could not read file with any supported encoding"
+            logger.error(f"{error_msg}: {filepath}")
+            print(f"Error: {error_msg}", file=sys.stderr)
+            sys.exit(1)
+
+        # Read and import CSV
+        records = records[[column for column in records.columns if column in table_columns]]
+        records_imported = append_records(conn, 'comdirect_tax_detail_staging', records)
+
+        success_msg = f"Successfully imported {records_imported} records from {Path(filepath).name}"
+        table_msg = f"Data loaded into: comdirect_tax_detail_staging"
+        logger.info(success_msg)
+        logger.info(table_msg)
+        print(success_msg)
+        print(table_msg)
 
-        for header, value in row.items():
-            normalized = _normalize_header(header)
-            field_info = FIELD_DEFINITIONS.get(normalized)
-            if not field_info:
-                continue
-            column_name, parser = field_info
-            parsed_value = parser(value)
-            record[column_name] = parsed_value
-
-        record['source_file'] = filepath_obj.name
-
-        for column_name, column_value in list(record.items()):
-            if isinstance(column_value, Decimal):
-                record[column_name] = float(column_value)
-
-        insert_columns = [col for col in record.keys() if col in table_columns]
-        if not insert_columns:
-            logger.debug("Skipping row because no mapped columns were found in staging table")
-            continue
-
-        placeholders = ','.join(['?'] * len(insert_columns))
-        column_sql = ','.join(insert_columns)
-        cursor.execute(
-            f"INSERT INTO comdirect_tax_detail_staging ({column_sql}) VALUES ({placeholders})",
-            tuple(record[col] for col in insert_columns)
-        )
-
-        records_imported += 1
-
-    conn.commit()
     conn.close()
 
-    success_msg = f"Successfully imported {records_imported} records from {filepath_obj.name}"
-    table_msg = f"Data loaded into: comdirect_tax_detail_staging"
-    logger.info(success_msg)
-    logger.info(table_msg)
-    print(success_msg)
-    print(table_msg)
-
 
 def main():
     parser = argparse.ArgumentParser(
         description="Load Comdirect tax detail export into staging table"
     )
     parser.add_argument(
-        "filepath",
-        help="Path to the Comdirect tax detail CSV file"
+        "filepaths",
+        nargs="+",
+        help="Path(s) to the Comdirect tax detail CSV file(s)"
     )
     parser.add_argument(
         "--db",
@@ -185,7 +185,7 @@ def main():
     )
     
     args = parser.parse_args()
-    load_comdirect_tax_detail(args.filepath, args.db)
+    load_comdirect_tax_details(args.filepaths, args.db)
 
 
 if __name__ == "__main__":
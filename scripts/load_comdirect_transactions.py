@@ -9,18 +9,24 @@ Example:
 """
 
 import argparse
-import csv
 import logging
 import re
-import sqlite3
 import sys
 from pathlib import Path
 
 # Add parent directory to path to import configuration
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from configuration import DB_PATH, LOADER_LOG_PATH
-from src.utils.parse import parse_german_decimal, parse_german_date
+from src.repository.connection import connect_staging_db
 from src.repository.create_db import create_comdirect_transactions_staging
+from src.utils.loader import (
+    append_records,
+    build_staging_records,
+    parse_date_column,
+    parse_decimal_column,
+    parse_text_column,
+    read_german_csv,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -33,6 +39,59 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Header patterns that tolerate mangled umlauts (Geschäftsart, Stücke/Nom.)
+GESCHAEFTSART_RE = re.compile(r'gesch.*ftsart')
+STUECKE_RE = re.compile(r'st.*cke/nom.')
+
+
+def _column_key(header: str) -> str | None:
+    """Map an export header to its staging field (handles potential encoding issues)."""
+    key_lower = header.lower().strip()
+    
+    if 'datum' in key_lower and 'ausf' in key_lower:
+        return 'datum_ausfuehrung'
+    elif 'bezeichnung' in key_lower:
+        return 'bezeichnung'
+    elif 'wkn' == key_lower:
+        return 'wkn'
+    elif GESCHAEFTSART_RE.search(key_lower):
+        return 'geschaeftsart'
+    elif STUECKE_RE.search(key_lower):
+        return 'stuecke_nominal'
+    elif 'kurs' == key_lower:
+        return 'kurs'
+    elif 'kurswert eur' in key_lower:
+        return 'kurswert_eur'
+    elif 'kundenendbetrag eur' in key_lower:
+        return 'kundenendbetrag_eur'
+    elif 'entgelt (summe eigen und fremd) eur' in key_lower:
+        return 'entgelt_eur'
+    return None
+
+
+def _resolve_columns(header: list[str]) -> dict[str, int]:
+    """Position of each staging field in the header; a later matching column wins."""
+    col_idx = {}
+    for index, name in enumerate(header):
+        key = _column_key(name)
+        if key is not None:
+            col_idx[key] = index
+    return col_idx
+
+
+# Staging columns in insert order with the parser applied to their raw text
+FIELD_PARSERS = {
+    'datum_ausfuehrung': parse_date_column,
+    'bezeichnung': parse_text_column,
+    'wkn': parse_text_column,
+    'geschaeftsart': parse_text_column,
+    'stuecke_nominal': parse_decimal_column,
+    'kurs': parse_decimal_column,
+    'kurswert_eur': parse_decimal_column,
+    'kundenendbetrag_eur': parse_decimal_column,
+    'entgelt_eur': parse_decimal_column,
+}
+
 
 def load_comdirect_transactions(filepath: str, db_path: str = None):
     """Load Comdirect transaction CSV into staging table."""
@@ -48,88 +107,26 @@ def load_comdirect_transactions(filepath: str, db_path: str = None):
     logger.info(f"Starting import of Comdirect transactions file: {filepath_obj.name}")
 
     # Connect to database
-    conn = sqlite3.connect(db_path)
+    conn = connect_staging_db(db_path)
     cursor = conn.cursor()
 
     # Create staging table if it doesn't exist
     create_comdirect_transactions_staging(cursor)
 
-    # Read and import CSV
-    records_imported = 0
-    
     # Try different encodings
     encodings = ['windows-1252', 'utf-8', 'latin-1']
-    csv_data = None
+    raw = read_german_csv(filepath, encodings)
     
-    for encoding in encodings:
-        try:
-            with open(filepath, 'r', encoding=encoding) as f:
-                csv_data = f.read()
-            break
-        except UnicodeDecodeError:
-            continue
-    
-    if csv_data is None:
+    if raw is None:
         error_msg = "Could not read file with any supported encoding"
         logger.error(f"{error_msg}: {filepath}")
         print(f"Error: {error_msg}", file=sys.stderr)
         sys.exit(1)
 
-    # Parse CSV
-    reader = csv.DictReader(csv_data.splitlines(), delimiter=';')
-    
-    for row in reader:
-        # Map column names (handle potential encoding issues)
-        datum_ausfuehrung = None
-        bezeichnung = None
-        geschaeftsart = None
-        wkn = None
-        stuecke_nominal = None
-        kurs = None
-        kurswert_eur = None
-        kundenendbetrag_eur = None
-        entgelt_eur = None
-        
-        for key, value in row.items():
-            key_lower = key.lower().strip()
-            
-            if 'datum' in key_lower and 'ausf' in key_lower:
-                datum_ausfuehrung = parse_german_date(value)
-            elif 'bezeichnung' in key_lower:
-                bezeichnung = value.strip() if value else None
-            elif 'wkn' == key_lower:
-                wkn = value.strip() if value else None
-            elif re.search(r'gesch.*ftsart', key_lower):
-                geschaeftsart = value.strip() if value else None
-            elif re.search(r'st.*cke/nom.', key_lower):
-                stuecke_nominal = parse_german_decimal(value)
-            elif 'kurs' == key_lower:
-                kurs = parse_german_decimal(value)
-            elif 'kurswert eur' in key_lower:
-                kurswert_eur = parse_german_decimal(value)
-            elif 'kundenendbetrag eur' in key_lower:
-                kundenendbetrag_eur = parse_german_decimal(value)
-            elif 'entgelt (summe eigen und fremd) eur' in key_lower:
-                entgelt_eur = parse_german_decimal(value)
-        
-        # Convert Decimal to float for SQLite compatibility
-        stuecke_nominal_float = float(stuecke_nominal) if stuecke_nominal is not None else None
-        kurs_float = float(kurs) if kurs is not None else None
-        kurswert_eur_float = float(kurswert_eur) if kurswert_eur is not None else None
-        kundenendbetrag_eur_float = float(kundenendbetrag_eur) if kundenendbetrag_eur is not None else None
-        entgelt_eur_float = float(entgelt_eur) if entgelt_eur is not None else None
-        
-        cursor.execute("""
-                        INSERT INTO comdirect_transactions_staging 
-                        (datum_ausfuehrung, bezeichnung, wkn, geschaeftsart, stuecke_nominal, 
-                         kurs, kurswert_eur, kundenendbetrag_eur, entgelt_eur, source_file)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (datum_ausfuehrung, bezeichnung, wkn, geschaeftsart, stuecke_nominal_float,
-                            kurs_float, kurswert_eur_float, kundenendbetrag_eur_float, entgelt_eur_float, filepath_obj.name))
-        
-        records_imported += 1
-
-    conn.commit()
+    # Parse CSV columns vectorized and insert them with multi-row INSERTs
+    col_idx = _resolve_columns([str(header) for header in raw.columns])
+    records = build_staging_records(raw, col_idx, FIELD_PARSERS, filepath_obj.name)
+    records_imported = append_records(conn, 'comdirect_transactions_staging', records)
     conn.close()
 
     success_msg = f"Successfully imported {records_imported} records from {filepath_obj.name}"
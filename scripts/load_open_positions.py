@@ -6,20 +6,26 @@ import argparse
 import csv
 import logging
 import re
-import sqlite3
 import sys
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Iterator
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from configuration import DB_PATH, LOADER_LOG_PATH
+from src.repository.connection import connect_staging_db
 from src.repository.create_db import create_open_position_staging_t
-from src.utils.parse import parse_date, parse_german_decimal
+from src.utils.parse import parse_date, parse_german_float
 
 MANDATORY_COLUMNS = {"broker", "security_name", "share_price"}
 FILENAME_DATE_RE = re.compile(r"(\d{8})")
+INSERT_SQL = """
+    INSERT INTO open_position_staging_t
+        (broker, security_name, shares, share_price, amount, position_date, source_file)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
 
 logging.basicConfig(
     level=logging.INFO,
@@ -42,6 +48,11 @@ def read_csv_rows(filepath: Path) -> Iterable[dict[str, str]]:
         for row in reader:
             yield row
 
+
+# Snapshot files repeat the same few position dates on every row
+_parse_position_date = lru_cache(maxsize=2048)(parse_date)
+
+
 def infer_date_from_filename(path: Path) -> str | None:
     match = FILENAME_DATE_RE.search(path.name)
     if not match:
@@ -62,6 +73,38 @@ def parse_cli_date(value: str) -> str:
     return normalized
 
 
+def _position_rows(source_path: Path, default_position_date: str | None) -> Iterator[tuple]:
+    """Yield validated staging tuples, skipping (and logging) unusable rows."""
+    for row in read_csv_rows(source_path):
+        broker = (row.get("broker") or "").strip()
+        security_name = (row.get("security_name") or "").strip()
+        if not broker or not security_name:
+            logger.warning("Skipping row with missing broker or security name: %s", row)
+            continue
+
+        shares = parse_german_float(row.get("shares") or "")
+        share_price = parse_german_float(row.get("share_price") or "")
+        if share_price is None:
+            logger.warning("Skipping row with invalid share price: %s", row)
+            continue
+
+        amount = parse_german_float(row.get("amount") or "")
+        position_date = _parse_position_date(row.get("date") or "") or default_position_date
+        if position_date is None:
+            logger.warning("Skipping row with missing position date: %s", row)
+            continue
+
+        yield (
+            broker,
+            security_name,
+            shares,
+            share_price,
+            amount,
+            position_date,
+            source_path.name,
+        )
+
+
 def load_open_positions(
     filepath: str,
     db_path: str | None = None,
@@ -77,57 +120,22 @@ def load_open_positions(
 
     logger.info("Starting import of open positions file: %s", source_path.name)
 
-    conn = sqlite3.connect(db_path)
+    conn = connect_staging_db(db_path)
     cursor = conn.cursor()
     create_open_position_staging_t(cursor)
 
     default_position_date = position_date_override or infer_date_from_filename(source_path)
 
-    records_imported = 0
-    for row in read_csv_rows(source_path):
-        broker = (row.get("broker") or "").strip()
-        security_name = (row.get("security_name") or "").strip()
-        if not broker or not security_name:
-            logger.warning("Skipping row with missing broker or security name: %s", row)
-            continue
-
-        shares = parse_german_decimal(row.get("shares") or "")
-        share_price = parse_german_decimal(row.get("share_price") or "")
-        if share_price is None:
-            logger.warning("Skipping row with invalid share price: %s", row)
-            continue
-
-        amount = parse_german_decimal(row.get("amount") or "")
-        position_date = parse_date(row.get("date") or "") or default_position_date
-        if position_date is None:
-            logger.warning("Skipping row with missing position date: %s", row)
-            continue
-
-        shares_float = float(shares) if shares is not None else None
-        share_price_float = float(share_price) if share_price is not None else None
-        amount_float = float(amount) if amount is not None else None
-
-        cursor.execute(
-            """
-            INSERT INTO open_position_staging_t
-                (broker, security_name, shares, share_price, amount, position_date, source_file)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                broker,
-                security_name,
-                shares_float,
-                share_price_float,
-                amount_float,
-                position_date,
-                source_path.name,
-            ),
-        )
-
-        records_imported += 1
-
-    conn.commit()
-    conn.close()
+    # executemany pulls rows straight from the generator, so memory stays
+    # flat regardless of file size
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor.executemany(INSERT_SQL, _position_rows(source_path, default_position_date))
+        records_imported = cursor.rowcount
+        conn.commit()
+    finally:
+        # Closing without a commit rolls back and releases the write lock
+        conn.close()
 
     logger.info("Successfully imported %s records from %s", records_imported, source_path.name)
     print(f"Successfully imported {records_imported} records from {source_path.name}")
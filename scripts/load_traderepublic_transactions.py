@@ -2,24 +2,37 @@
 Load TradeRepublic transaction export into staging table.
 
 Usage:
-    python scripts/load_traderepublic_transactions.py <filepath>
+    python scripts/load_traderepublic_transactions.py <filepath> [--fast]
+
+--fast skips the rollback journal and fsyncs while loading. Use it only for
+initial loads into a database you can rebuild from the exports: with the
+journal off a failed load cannot be rolled back and leaves the rows written so
+far in the staging table.
 
 Example:
     python scripts/load_traderepublic_transactions.py data/input/traderepublic_transactions.csv
 """
 
 import argparse
-import csv
 import logging
-import sqlite3
 import sys
 from pathlib import Path
 
+import pandas as pd
+
 # Add parent directory to path to import configuration
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from configuration import DB_PATH, LOADER_LOG_PATH
-from src.utils.parse import parse_german_decimal as parse_decimal, parse_date
+from src.utils.parse import parse_date
+from src.repository.connection import connect_staging_db, restore_journal
 from src.repository.create_db import create_traderepublic_transactions_staging
+from src.utils.loader import (
+    append_records,
+    build_staging_records,
+    parse_decimal_column,
+    parse_text_column,
+    read_german_csv,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -32,9 +45,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Header names (lowercased, stripped) that map onto staging columns
+COLUMN_NAMES = frozenset({
+    'date', 'transaction_type', 'security_name', 'shares', 'price', 'amount',
+    'financial_transaction_tax',
+})
+
+
+def _resolve_columns(header: list[str]) -> dict[str, int]:
+    """Position of each staging field in the header; a later matching column wins."""
+    col_idx = {}
+    for index, name in enumerate(header):
+        key_lower = name.lower().strip()
+        if key_lower in COLUMN_NAMES:
+            col_idx[key_lower] = index
+    return col_idx
+
+
+def _parse_date_column(values: pd.Series) -> pd.Series:
+    """Normalize the mixed date formats accepted by parse_date, once per distinct value."""
+    codes, uniques = pd.factorize(values)
+    parsed = pd.Series([parse_date(value) for value in uniques], dtype=object)
+    return pd.Series(parsed.to_numpy()[codes], index=values.index, dtype=object)
+
+
+def _parse_transaction_type_column(values: pd.Series) -> pd.Series:
+    return parse_text_column(values.str.lower())
+
+
+# Staging columns in insert order with the parser applied to their raw text
+FIELD_PARSERS = {
+    'date': _parse_date_column,
+    'transaction_type': _parse_transaction_type_column,
+    'security_name': parse_text_column,
+    'shares': parse_decimal_column,
+    'price': parse_decimal_column,
+    'amount': parse_decimal_column,
+    'financial_transaction_tax': parse_decimal_column,
+}
 
-def load_traderepublic_transactions(filepath: str, db_path: str = None):
-    """Load TradeRepublic transaction CSV into staging table."""
+
+def load_traderepublic_transactions(filepath: str, db_path: str = None, fast: bool = False):
+    """Load TradeRepublic transaction CSV into staging table (fast: non-durable initial load)."""
     if db_path is None:
         db_path = str(DB_PATH)
     
@@ -47,82 +99,39 @@ def load_traderepublic_transactions(filepath: str, db_path: str = None):
     logger.info(f"Starting import of TradeRepublic transactions file: {filepath_obj.name}")
 
     # Connect to database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Create staging table if it doesn't exist
-    create_traderepublic_transactions_staging(cursor)
-
-    # Read and import CSV
-    records_imported = 0
-    
-    # Try different encodings
-    encodings = ['utf-8', 'windows-1252', 'latin-1']
-    csv_data = None
-    
-    for encoding in encodings:
-        try:
-            with open(filepath, 'r', encoding=encoding) as f:
-                csv_data = f.read()
-            break
-        except UnicodeDecodeError:
-            continue
-    
-    if csv_data is None:
-        error_msg = "Could not read file with any supported encoding"
-        logger.error(f"{error_msg}: {filepath}")
-        print(f"Error: {error_msg}", file=sys.stderr)
-        sys.exit(1)
-
-    # Parse CSV (semicolon-delimited)
-    reader = csv.DictReader(csv_data.splitlines(), delimiter=';')
-    
-    for row in reader:
-        # Map column names (handle various possible column names)
-        date = None
-        transaction_type = None
-        security_name = None
-        shares = None
-        price = None
-        amount = None
-        financial_transaction_tax = None
-        
-        for key, value in row.items():
-            key_lower = key.lower().strip()
-            
-            if key_lower == 'date':
-                date = parse_date(value)
-            elif 'transaction_type' == key_lower:
-                transaction_type = value.strip().lower() if value else None
-            elif 'security_name' == key_lower:
-                security_name = value.strip() if value else None
-            elif key_lower == 'shares':
-                shares = parse_decimal(value)
-            elif key_lower == 'price':
-                price = parse_decimal(value)
-            elif key_lower == 'amount':
-                amount = parse_decimal(value)
-            elif key_lower == 'financial_transaction_tax':
-                financial_transaction_tax = parse_decimal(value)
-        
-        # Convert Decimal to float for SQLite compatibility
-        shares_float = float(shares) if shares is not None else None
-        price_float = float(price) if price is not None else None
-        amount_float = float(amount) if amount is not None else None
-        financial_transaction_tax_float = float(financial_transaction_tax) if financial_transaction_tax is not None else None
-        
-        cursor.execute("""
-            INSERT INTO traderepublic_transactions_staging 
-            (date, transaction_type, security_name, shares, price, amount, 
-             financial_transaction_tax, source_file)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (date, transaction_type, security_name, shares_float, price_float, amount_float,
-              financial_transaction_tax_float, filepath_obj.name))
-        
-        records_imported += 1
-
-    conn.commit()
-    conn.close()
+    conn = connect_staging_db(db_path, fast=fast)
+    try:
+        cursor = conn.cursor()
+
+        # Create staging table if it doesn't exist
+        create_traderepublic_transactions_staging(cursor)
+
+        # Try different encodings
+        encodings = ['utf-8', 'windows-1252', 'latin-1']
+        raw = read_german_csv(filepath, encodings)
+
+        if raw is None:
+            error_msg = "Could not read file with any supported encoding"
+            logger.error(f"{error_msg}: {filepath}")
+            print(f"Error: {error_msg}", file=sys.stderr)
+            sys.exit(1)
+
+        # Parse CSV (semicolon-delimited) columns vectorized and insert them with multi-row INSERTs
+        col_idx = _resolve_columns([str(header) for header in raw.columns])
+        records = build_staging_records(raw, col_idx, FIELD_PARSERS, filepath_obj.name)
+        records_imported = append_records(conn, 'traderepublic_transactions_staging', records)
+    except Exception:
+        if fast:
+            # Without a journal the rollback cannot undo the rows already written
+            logger.error(
+                "Import failed in --fast mode; traderepublic_transactions_staging may hold "
+                "a partial load. Rebuild the database from the exports."
+            )
+        raise
+    finally:
+        if fast:
+            restore_journal(conn)
+        conn.close()
 
     success_msg = f"Successfully imported {records_imported} records from {filepath_obj.name}"
     table_msg = f"Data loaded into: traderepublic_transactions_staging"
@@ -145,9 +154,14 @@ def main():
         default=None,
         help=f"Path to SQLite database (default: {DB_PATH})"
     )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Initial load without journal or fsync (a failed load is not rolled back)"
+    )
     
     args = parser.parse_args()
-    load_traderepublic_transactions(args.filepath, args.db)
+    load_traderepublic_transactions(args.filepath, args.db, args.fast)
 
 
 if __name__ == "__main__":
@@ -5,9 +5,14 @@ This script analyzes the comdirect tax export file to determine if it contains
 all necessary information to recreate the transaction analysis file.
 """
 
-import csv
 from pathlib import Path
-from collections import defaultdict, Counter
+
+import pandas as pd
+
+
+def _read_text_csv(path: Path, **options) -> pd.DataFrame:
+    """Read a CSV with every cell kept as text, like csv.DictReader."""
+    return pd.read_csv(path, dtype=str, keep_default_na=False, **options)
 
 
 def analyze_tax_export(tax_export_file: Path, transaction_analysis_file: Path) -> None:
@@ -20,58 +25,33 @@ def analyze_tax_export(tax_export_file: Path, transaction_analysis_file: Path) -
     print()
     
     # Load transaction analysis securities
-    analysis_securities = set()
-    analysis_transactions = []
-    
-    with open(transaction_analysis_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            security = row['Security Name'].strip()
-            analysis_securities.add(security)
-            analysis_transactions.append({
-                'security': security,
-                'buy_date': row['Buy Date'],
-                'sell_date': row['Sell Date'],
-                'shares': float(row['Share Count'].replace(',', '.')),
-                'invested': float(row['Invested Value'].replace(',', '.')),
-                'pl': float(row['Realized P/L'].replace(',', '.'))
-            })
+    # Only the security names feed the comparison below
+    analysis = _read_text_csv(transaction_analysis_file, encoding='utf-8', usecols=['Security Name'])
+    analysis_securities = set(analysis['Security Name'].str.strip())
     
     print(f"Transaction Analysis File:")
-    print(f"  - Total transaction lines: {len(analysis_transactions)}")
+    print(f"  - Total transaction lines: {len(analysis)}")
     print(f"  - Unique securities: {len(analysis_securities)}")
     print()
     
-    # Analyze tax export
-    vorgang_counts = Counter()
-    sell_transactions = []
-    buy_transactions = []
-    tax_securities = set()
+    # Analyze tax export in one columnar scan; skipinitialspace lets the parser
+    # unquote ' "Name"' cells itself instead of stripping quotes per value
+    tax_export = _read_text_csv(
+        tax_export_file,
+        sep=';',
+        encoding='windows-1252',
+        usecols=['Vorgang', 'Bezeichnung'],
+        quotechar='"',
+        skipinitialspace=True,
+    )
+    vorgang_values = tax_export['Vorgang'].str.strip()
+    vorgang_counts = vorgang_values.value_counts().to_dict()
+    
+    securities = tax_export['Bezeichnung'].str.strip()
+    tax_securities = set(securities[securities != ''])
     
-    with open(tax_export_file, 'r', encoding='windows-1252') as f:
-        reader = csv.DictReader(f, delimiter=';')
-        
-        for row in reader:
-            vorgang = row['Vorgang'].strip()
-            vorgang_counts[vorgang] += 1
-            
-            security = row.get('Bezeichnung', '').strip().strip('"')
-            if security:
-                tax_securities.add(security)
-            
-            if 'Verkauf' in vorgang:
-                sell_transactions.append({
-                    'date': row['Buchungstag'].strip().strip('"'),
-                    'security': security,
-                    'vorgang': vorgang
-                })
-            
-            if 'Kauf' in vorgang:
-                buy_transactions.append({
-                    'date': row['Buchungstag'].strip().strip('"'),
-                    'security': security,
-                    'vorgang': vorgang
-                })
+    sell_count = int(vorgang_values.str.contains('Verkauf', regex=False).sum())
+    buy_count = int(vorgang_values.str.contains('Kauf', regex=False).sum())
     
     print(f"Tax Export File:")
     print(f"  - Total transaction lines: {sum(vorgang_counts.values())}")
@@ -83,8 +63,8 @@ def analyze_tax_export(tax_export_file: Path, transaction_analysis_file: Path) -
         print(f"  - {vorgang}: {count}")
     print()
     
-    print(f"Sell transactions (Verkauf*): {len(sell_transactions)}")
-    print(f"Buy transactions (Kauf*): {len(buy_transactions)}")
+    print(f"Sell transactions (Verkauf*): {sell_count}")
+    print(f"Buy transactions (Kauf*): {buy_count}")
     print()
     
     # Key findings
@@ -93,7 +73,7 @@ def analyze_tax_export(tax_export_file: Path, transaction_analysis_file: Path) -
     print("="*80)
     print()
     
-    if len(buy_transactions) == 0:
+    if buy_count == 0:
         print("❌ CRITICAL: No regular buy/purchase transactions found in tax export!")
         print("   The tax export only contains:")
         print("   - 'Kauf ausl.m.Ertragsant' (foreign purchase with accrued interest)")
@@ -128,9 +108,10 @@ def analyze_tax_export(tax_export_file: Path, transaction_analysis_file: Path) -
     print()
     print("Securities Coverage Analysis:")
     print("-" * 80)
+    # Reuse the intersection so the differences only subtract the shared names
     securities_in_both = analysis_securities & tax_securities
-    securities_only_in_analysis = analysis_securities - tax_securities
-    securities_only_in_tax = tax_securities - analysis_securities
+    securities_only_in_analysis = analysis_securities - securities_in_both
+    securities_only_in_tax = tax_securities - securities_in_both
     
     print(f"Securities in both files: {len(securities_in_both)}")
     print(f"Securities only in transaction analysis: {len(securities_only_in_analysis)}")
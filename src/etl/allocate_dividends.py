@@ -14,17 +14,21 @@ import sqlite3
 from collections import defaultdict
 from dataclasses import dataclass
 from datetime import date
+from operator import attrgetter
 from pathlib import Path
 from typing import DefaultDict, Dict, Iterable, List, Tuple
 
 import sys
 
+import numpy as np
+
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from configuration import DB_PATH
 from src.etl.portfolio_xirr import FLOAT_TOLERANCE, _coalesce_amount, _to_date
+from src.repository.connection import connect_staging_db
 from src.repository.create_db import (
     create_broker_t,
     create_dividend_allocation_t,
@@ -35,6 +39,15 @@ from src.repository.create_db import (
 
 logger = logging.getLogger(__name__)
 
+# Ids per IN (...) clause, well below SQLite's 999 bound parameters
+SQL_BATCH_SIZE = 500
+
+# Sell ordinal of segments whose shares have not been sold
+OPEN_ENDED_ORDINAL = date.max.toordinal()
+
+# (broker_id, security_id, dividend_transaction_id, buy_transaction_id, shares, allocated_amount)
+AllocationRow = Tuple[int, int, int, int, float, float]
+
 
 @dataclass(frozen=True)
 class HoldingSegment:
@@ -43,19 +56,17 @@ class HoldingSegment:
     buy_transaction_id: int
     broker_id: int
     security_id: int
-    buy_date: date
-    sell_date: date | None
+    buy_ordinal: int
+    sell_ordinal: int  # OPEN_ENDED_ORDINAL while the shares are still held
     shares: float
 
 
-def _load_match_segments(cursor: sqlite3.Cursor) -> Tuple[
-    DefaultDict[Tuple[int, int], List[HoldingSegment]],
-    Dict[int, float],
-]:
-    """Return matched share segments and their totals per BUY transaction."""
+def _load_match_segments(
+    cursor: sqlite3.Cursor,
+) -> DefaultDict[Tuple[int, int], List[HoldingSegment]]:
+    """Return matched share segments per (broker, security)."""
 
     segments: DefaultDict[Tuple[int, int], List[HoldingSegment]] = defaultdict(list)
-    matched_shares: Dict[int, float] = defaultdict(float)
 
     cursor.execute(
         """
@@ -71,7 +82,7 @@ def _load_match_segments(cursor: sqlite3.Cursor) -> Tuple[
         ORDER BY m.broker_id, m.security_id, bt.transaction_date, st.transaction_date, m.id
         """
     )
-    for row in cursor.fetchall():
+    for row in cursor:
         shares = abs(float(row["shares"] or 0.0))
         if shares <= FLOAT_TOLERANCE:
             continue
@@ -87,43 +98,48 @@ def _load_match_segments(cursor: sqlite3.Cursor) -> Tuple[
                 buy_transaction_id=buy_id,
                 broker_id=broker_id,
                 security_id=security_id,
-                buy_date=buy_date,
-                sell_date=sell_date,
+                buy_ordinal=buy_date.toordinal(),
+                sell_ordinal=sell_date.toordinal(),
                 shares=shares,
             )
         )
-        matched_shares[buy_id] = matched_shares.get(buy_id, 0.0) + shares
 
-    return segments, matched_shares
+    return segments
 
 
 def _add_open_segments(
     cursor: sqlite3.Cursor,
     segments: DefaultDict[Tuple[int, int], List[HoldingSegment]],
-    matched_shares: Dict[int, float],
 ) -> None:
     """Append unmatched BUY shares as open-ended holding segments."""
 
+    # The matched totals count the same match rows _load_match_segments keeps
     cursor.execute(
         """
-        SELECT id, broker_id, security_id, transaction_date, shares
-        FROM transaction_t
-        WHERE transaction_type = 'buy'
-        ORDER BY broker_id, security_id, transaction_date, id
-        """
+        SELECT t.id, t.broker_id, t.security_id, t.transaction_date,
+               ABS(COALESCE(t.shares, 0)) - COALESCE(m.matched, 0) AS remaining
+        FROM transaction_t t
+        LEFT JOIN (
+            SELECT mt.buy_transaction_id, SUM(ABS(mt.shares)) AS matched
+            FROM transaction_match_t mt
+            JOIN transaction_t st ON st.id = mt.sell_transaction_id
+            WHERE ABS(mt.shares) > :tolerance
+              AND st.transaction_date IS NOT NULL
+            GROUP BY mt.buy_transaction_id
+        ) m ON m.buy_transaction_id = t.id
+        WHERE t.transaction_type = 'buy'
+          AND ABS(COALESCE(t.shares, 0)) > :tolerance
+          AND remaining > :tolerance
+        ORDER BY t.broker_id, t.security_id, t.transaction_date, t.id
+        """,
+        {"tolerance": FLOAT_TOLERANCE},
     )
-    for row in cursor.fetchall():
-        total_shares = abs(float(row["shares"] or 0.0))
-        if total_shares <= FLOAT_TOLERANCE:
-            continue
+    for row in cursor:
         buy_date = _to_date(row["transaction_date"])
         if buy_date is None:
             continue
         buy_id = int(row["id"])
-        matched = matched_shares.get(buy_id, 0.0)
-        remaining = total_shares - matched
-        if remaining <= FLOAT_TOLERANCE:
-            continue
+        remaining = float(row["remaining"])
         broker_id = int(row["broker_id"])
         security_id = int(row["security_id"])
         segments[(broker_id, security_id)].append(
@@ -131,150 +147,186 @@ def _add_open_segments(
                 buy_transaction_id=buy_id,
                 broker_id=broker_id,
                 security_id=security_id,
-                buy_date=buy_date,
-                sell_date=None,
+                buy_ordinal=buy_date.toordinal(),
+                sell_ordinal=OPEN_ENDED_ORDINAL,
                 shares=remaining,
             )
         )
 
 
-def _sort_segments(segments: DefaultDict[Tuple[int, int], List[HoldingSegment]]) -> None:
-    for key in segments:
-        segments[key].sort(
-            key=lambda seg: (
-                seg.buy_date,
-                seg.sell_date if seg.sell_date is not None else date.max,
-            )
+@dataclass(frozen=True)
+class SegmentArrays:
+    """Holding segments of one (broker, security) as parallel arrays sorted by buy date."""
+
+    buy_ordinal: np.ndarray
+    sell_ordinal: np.ndarray
+    shares: np.ndarray
+    buy_transaction_id: np.ndarray
+
+
+def _build_segment_arrays(
+    segments: DefaultDict[Tuple[int, int], List[HoldingSegment]],
+) -> Dict[Tuple[int, int], SegmentArrays]:
+    """Sort each key's segments and lay them out as arrays for vectorized filtering."""
+
+    arrays: Dict[Tuple[int, int], SegmentArrays] = {}
+    for key, key_segments in segments.items():
+        key_segments.sort(key=attrgetter("buy_ordinal", "sell_ordinal"))
+        arrays[key] = SegmentArrays(
+            buy_ordinal=np.array([seg.buy_ordinal for seg in key_segments], dtype=np.int32),
+            sell_ordinal=np.array([seg.sell_ordinal for seg in key_segments], dtype=np.int32),
+            shares=np.array([seg.shares for seg in key_segments], dtype=np.float64),
+            buy_transaction_id=np.array(
+                [seg.buy_transaction_id for seg in key_segments], dtype=np.int64
+            ),
         )
+    return arrays
 
 
 def _eligible_segments(
-    all_segments: Iterable[HoldingSegment],
-    dividend_date: date,
-    previous_dividend_date: date | None,
-) -> List[HoldingSegment]:
-    """Return segments that were open between previous and current dividend dates."""
-
-    eligible: List[HoldingSegment] = []
-    prev_cutoff = previous_dividend_date or date.min
-    for segment in all_segments:
-        if segment.buy_date >= dividend_date:
-            continue
-        sell_date = segment.sell_date
-        if sell_date is None or sell_date >= dividend_date or sell_date > prev_cutoff:
-            eligible.append(segment)
-    return eligible
+    segments: SegmentArrays,
+    dividend_ordinal: int,
+    prev_cutoff: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return shares and buy ids of segments open between previous and current dividend dates."""
+
+    # Segments are sorted by buy date, so those bought before the dividend form a prefix
+    bought = int(np.searchsorted(segments.buy_ordinal, dividend_ordinal, side="left"))
+    sell_ordinal = segments.sell_ordinal[:bought]
+    mask = (sell_ordinal >= dividend_ordinal) | (sell_ordinal > prev_cutoff)
+    return segments.shares[:bought][mask], segments.buy_transaction_id[:bought][mask]
 
 
-def _record_error(cursor: sqlite3.Cursor, dividend_id: int, message: str) -> None:
+def _record_error(errors: List[Tuple[str, int]], dividend_id: int, message: str) -> None:
     logger.warning("Dividend %s skipped: %s", dividend_id, message)
-    cursor.execute(
+    errors.append((message[:500], dividend_id))
+
+
+def _write_errors(cursor: sqlite3.Cursor, errors: List[Tuple[str, int]]) -> None:
+    cursor.executemany(
         "UPDATE transaction_t SET error_message = ?, allocated = 0 WHERE id = ?",
-        (message[:500], dividend_id),
+        errors,
     )
 
 
 def _allocate_for_dividend(
-    cursor: sqlite3.Cursor,
+    errors: List[Tuple[str, int]],
     dividend_row: sqlite3.Row,
-    segments_by_security: Dict[Tuple[int, int], List[HoldingSegment]],
-    dividend_date: date,
-    previous_dividend_date: date | None,
-) -> Tuple[bool, int]:
+    segments_by_security: Dict[Tuple[int, int], SegmentArrays],
+    dividend_ordinal: int,
+    prev_cutoff: int,
+) -> Tuple[bool, List[AllocationRow]]:
     dividend_id = int(dividend_row["id"])
     broker_id = int(dividend_row["broker_id"])
     security_id = int(dividend_row["security_id"])
 
     amount = _coalesce_amount(dividend_row, prefer_net=False)
     if abs(amount) <= FLOAT_TOLERANCE:
-        _record_error(cursor, dividend_id, "Dividend amount is zero")
-        return False, 0
+        _record_error(errors, dividend_id, "Dividend amount is zero")
+        return False, []
 
     key = (broker_id, security_id)
-    segments = segments_by_security.get(key, [])
-    eligible_segments = _eligible_segments(segments, dividend_date, previous_dividend_date)
-    if not eligible_segments:
-        _record_error(cursor, dividend_id, "No eligible holdings on dividend date")
-        return False, 0
+    segments = segments_by_security.get(key)
+    if segments is None:
+        _record_error(errors, dividend_id, "No eligible holdings on dividend date")
+        return False, []
+    eligible_shares, eligible_buy_ids = _eligible_segments(
+        segments, dividend_ordinal, prev_cutoff
+    )
+    if not len(eligible_shares):
+        _record_error(errors, dividend_id, "No eligible holdings on dividend date")
+        return False, []
 
-    available_shares = sum(segment.shares for segment in eligible_segments)
+    available_shares = float(eligible_shares.sum())
     declared_shares = abs(float(dividend_row["shares"] or 0.0))
     total_shares = declared_shares if declared_shares > FLOAT_TOLERANCE else available_shares
     if total_shares <= FLOAT_TOLERANCE:
-        _record_error(cursor, dividend_id, "No share count available for allocation")
-        return False, 0
+        _record_error(errors, dividend_id, "No share count available for allocation")
+        return False, []
 
     per_share_amount = amount / total_shares
-    shares_left = total_shares
-    distributed_amount = 0.0
-    allocations: Dict[int, Dict[str, float]] = {}
-    allocation_order: List[int] = []
-
-    for segment in eligible_segments:
-        if declared_shares > FLOAT_TOLERANCE and shares_left <= FLOAT_TOLERANCE:
-            break
-        shares_to_use = segment.shares
-        if declared_shares > FLOAT_TOLERANCE:
-            shares_to_use = min(segment.shares, shares_left)
-        if shares_to_use <= FLOAT_TOLERANCE:
-            continue
-        allocation_value = shares_to_use * per_share_amount
-        buy_id = segment.buy_transaction_id
-        bucket = allocations.get(buy_id)
-        if bucket is None:
-            bucket = {"shares": 0.0, "amount": 0.0}
-            allocations[buy_id] = bucket
-            allocation_order.append(buy_id)
-        bucket["shares"] += shares_to_use
-        bucket["amount"] += allocation_value
-        shares_left -= shares_to_use
-        distributed_amount += allocation_value
-
-    if not allocations:
-        _record_error(cursor, dividend_id, "Could not distribute dividend across holdings")
-        return False, 0
-
+    if declared_shares > FLOAT_TOLERANCE:
+        # Water-fill the declared shares across segments in buy order
+        filled_before = np.concatenate(([0.0], np.cumsum(eligible_shares)[:-1]))
+        taken_shares = np.clip(total_shares - filled_before, 0.0, eligible_shares)
+    else:
+        taken_shares = eligible_shares
+    used = taken_shares > FLOAT_TOLERANCE
+    if not used.any():
+        _record_error(errors, dividend_id, "Could not distribute dividend across holdings")
+        return False, []
+    taken_shares = taken_shares[used]
+    taken_amounts = taken_shares * per_share_amount
+
+    lot_ids = eligible_buy_ids[used]
+    if len(set(lot_ids.tolist())) == len(lot_ids):
+        # Usually each segment is a different lot and there is nothing to sum
+        buy_ids, allocated_shares, allocated_amounts = lot_ids, taken_shares, taken_amounts
+    else:
+        # Sum per buy lot, keeping the lots in the order they were first allocated
+        buy_ids, first_seen, bucket = np.unique(lot_ids, return_index=True, return_inverse=True)
+        order = np.argsort(first_seen)
+        allocated_shares = np.bincount(bucket, weights=taken_shares)[order]
+        allocated_amounts = np.bincount(bucket, weights=taken_amounts)[order]
+        buy_ids = buy_ids[order]
+
+    shares_left = total_shares - float(taken_shares.sum())
+    distributed_amount = float(taken_amounts.sum())
     if shares_left > FLOAT_TOLERANCE and distributed_amount < amount:
-        remainder = amount - distributed_amount
-        if allocation_order:
-            last_bucket = allocations[allocation_order[-1]]
-            last_bucket["amount"] += remainder
-        distributed_amount += remainder
+        allocated_amounts[-1] += amount - distributed_amount
 
-    cursor.execute(
-        "DELETE FROM dividend_allocation_t WHERE dividend_transaction_id = ?",
-        (dividend_id,),
-    )
+    allocation_rows = [
+        (broker_id, security_id, dividend_id, buy_id, shares, allocated_amount)
+        for buy_id, shares, allocated_amount in zip(
+            buy_ids.tolist(), allocated_shares.tolist(), allocated_amounts.tolist()
+        )
+    ]
+    return True, allocation_rows
+
+
+def _chunks(values: List, size: int = SQL_BATCH_SIZE) -> Iterable[List]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _write_allocations(
+    cursor: sqlite3.Cursor,
+    allocated_ids: List[int],
+    allocation_rows: List[AllocationRow],
+) -> None:
+    """Replace the allocations of every allocated dividend in a few batched statements."""
+
+    for chunk in _chunks(allocated_ids):
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f"DELETE FROM dividend_allocation_t WHERE dividend_transaction_id IN ({placeholders})",
+            chunk,
+        )
     cursor.executemany(
         """
         INSERT INTO dividend_allocation_t
         (broker_id, security_id, dividend_transaction_id, buy_transaction_id, shares, allocated_amount)
         VALUES (?, ?, ?, ?, ?, ?)
         """,
-        [
-            (
-                broker_id,
-                security_id,
-                dividend_id,
-                buy_id,
-                allocation["shares"],
-                allocation["amount"],
-            )
-            for buy_id, allocation in allocations.items()
-        ],
-    )
-    cursor.execute(
-        "UPDATE transaction_t SET allocated = 1, error_message = NULL WHERE id = ?",
-        (dividend_id,),
+        allocation_rows,
     )
-    return True, len(allocations)
+    for chunk in _chunks(allocated_ids):
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f"UPDATE transaction_t SET allocated = 1, error_message = NULL WHERE id IN ({placeholders})",
+            chunk,
+        )
 
 
 def _load_unallocated_dividends(cursor: sqlite3.Cursor) -> List[sqlite3.Row]:
     cursor.execute(
         """
         SELECT id, broker_id, security_id, transaction_date, shares,
-               total_value, net_amount, price_per_share
+               total_value, net_amount, price_per_share,
+               LAG(transaction_date) OVER (
+                   PARTITION BY broker_id, security_id
+                   ORDER BY transaction_date, id
+               ) AS previous_dividend_date
         FROM transaction_t
         WHERE transaction_type = 'dividend'
           AND COALESCE(allocated, 0) = 0
@@ -290,9 +342,11 @@ def allocate_dividends(db_path: str | None = None) -> Dict[str, int]:
     if db_path is None:
         db_path = str(DB_PATH)
 
-    conn = sqlite3.connect(db_path)
+    conn = connect_staging_db(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
+    # One explicit transaction for the whole run, committed once at the end
+    conn.execute("BEGIN IMMEDIATE")
 
     create_broker_t(cursor)
     create_security_t(cursor)
@@ -300,9 +354,9 @@ def allocate_dividends(db_path: str | None = None) -> Dict[str, int]:
     create_transaction_match_t(cursor)
     create_dividend_allocation_t(cursor)
 
-    segments, matched_shares = _load_match_segments(cursor)
-    _add_open_segments(cursor, segments, matched_shares)
-    _sort_segments(segments)
+    segments = _load_match_segments(cursor)
+    _add_open_segments(cursor, segments)
+    segment_arrays = _build_segment_arrays(segments)
 
     dividend_rows = _load_unallocated_dividends(cursor)
     stats = {
@@ -311,7 +365,9 @@ def allocate_dividends(db_path: str | None = None) -> Dict[str, int]:
         "dividends_failed": 0,
         "allocations_created": 0,
     }
-    previous_dividend_dates: Dict[Tuple[int, int], date] = {}
+    allocated_ids: List[int] = []
+    allocation_rows: List[AllocationRow] = []
+    errors: List[Tuple[str, int]] = []
 
     if not dividend_rows:
         logger.info("No unallocated dividends found")
@@ -322,28 +378,30 @@ def allocate_dividends(db_path: str | None = None) -> Dict[str, int]:
     for dividend_row in dividend_rows:
         dividend_date = _to_date(dividend_row["transaction_date"])
         if dividend_date is None:
-            _record_error(cursor, int(dividend_row["id"]), "Missing transaction_date on dividend")
+            _record_error(errors, int(dividend_row["id"]), "Missing transaction_date on dividend")
             stats["dividends_failed"] += 1
             continue
 
-        key = (int(dividend_row["broker_id"]), int(dividend_row["security_id"]))
-        previous_dividend_date = previous_dividend_dates.get(key)
-
-        success, allocation_count = _allocate_for_dividend(
-            cursor,
+        previous_dividend_date = _to_date(dividend_row["previous_dividend_date"])
+        success, rows = _allocate_for_dividend(
+            errors,
             dividend_row,
-            segments,
-            dividend_date,
-            previous_dividend_date,
+            segment_arrays,
+            dividend_date.toordinal(),
+            (previous_dividend_date or date.min).toordinal(),
         )
-        previous_dividend_dates[key] = dividend_date
 
         if success:
+            allocated_ids.append(int(dividend_row["id"]))
+            allocation_rows.extend(rows)
             stats["dividends_allocated"] += 1
-            stats["allocations_created"] += allocation_count
+            stats["allocations_created"] += len(rows)
         else:
             stats["dividends_failed"] += 1
 
+    # Writes are collected across all dividends and flushed together in one transaction
+    _write_errors(cursor, errors)
+    _write_allocations(cursor, allocated_ids, allocation_rows)
     conn.commit()
     conn.close()
 
@@ -32,6 +32,7 @@ if str(PROJECT_ROOT) not in sys.path:
 
 from configuration import DB_PATH
 from src.etl.portfolio_xirr import _coalesce_amount, _to_date
+from src.repository.connection import connect_staging_db
 from src.repository.create_db import (
     create_broker_t,
     create_security_t,
@@ -43,6 +44,16 @@ logger = logging.getLogger(__name__)
 
 FLOAT_TOLERANCE = 1e-9
 
+# Ids bound per IN (...) lookup of existing matches
+ID_CHUNK_SIZE = 100
+
+INSERT_MATCH_SQL = """
+    INSERT INTO transaction_match_t
+    (broker_id, security_id, buy_transaction_id, sell_transaction_id,
+     shares, allocated_cost, allocated_proceeds, allocated_fees, cost_basis_method)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
 
 @dataclass
 class BuyLot:
@@ -65,13 +76,108 @@ def _load_existing_allocations(
 ) -> Dict[int, float]:
     if not ids:
         return {}
-    placeholders = ",".join(["?"] * len(ids))
+    # Always bind ID_CHUNK_SIZE ids, padding the last chunk with a repeated id,
+    # so every call reuses the same cached statement
+    placeholders = ",".join(["?"] * ID_CHUNK_SIZE)
     query = (
         f"SELECT {column_name} AS tx_id, COALESCE(SUM(shares), 0) AS matched_shares "
         f"FROM transaction_match_t WHERE {column_name} IN ({placeholders}) GROUP BY {column_name}"
     )
-    cursor.execute(query, ids)
-    return {int(row["tx_id"]): float(row["matched_shares"] or 0.0) for row in cursor.fetchall()}
+    allocations: Dict[int, float] = {}
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        chunk = ids[start:start + ID_CHUNK_SIZE]
+        chunk += [chunk[-1]] * (ID_CHUNK_SIZE - len(chunk))
+        cursor.execute(query, chunk)
+        for row in cursor.fetchall():
+            allocations[int(row["tx_id"])] = float(row["matched_shares"] or 0.0)
+    return allocations
+
+
+def _match_group(
+    broker_id: int,
+    security_id: int,
+    buys: List[sqlite3.Row],
+    sells: List[sqlite3.Row],
+    buy_allocations: Dict[int, float],
+    sell_allocations: Dict[int, float],
+    cost_basis_method: str,
+) -> Tuple[List[Tuple], List[float]]:
+    """FIFO-match one (broker, security) group; returns match rows and unmatched sell shares."""
+    match_rows: List[Tuple] = []
+    unmatched_shares: List[float] = []
+
+    buy_lots: List[BuyLot] = []
+    # Index of the oldest lot with shares left; exhausted lots stay in the list
+    head = 0
+    for buy_row in buys:
+        buy_dt = _to_date(buy_row["transaction_date"])
+        shares = _abs_float(buy_row["shares"])
+        if buy_dt is None or shares <= 0:
+            continue
+
+        cost_basis_total = abs(_coalesce_amount(buy_row))
+        cost_per_share = cost_basis_total / shares if shares else 0.0
+        allocated = buy_allocations.get(int(buy_row["id"]), 0.0)
+        shares_remaining = shares - allocated
+        if shares_remaining <= FLOAT_TOLERANCE:
+            continue
+        buy_lots.append(
+            BuyLot(
+                tx_id=int(buy_row["id"]),
+                buy_date=buy_dt,
+                shares_remaining=shares_remaining,
+                cost_per_share=cost_per_share,
+            )
+        )
+
+    for sell_row in sells:
+        sell_dt = _to_date(sell_row["transaction_date"])
+        sell_tx_id = int(sell_row["id"])
+        sell_shares_total = _abs_float(sell_row["shares"])
+        if sell_dt is None or sell_shares_total <= 0:
+            continue
+
+        already_matched = sell_allocations.get(sell_tx_id, 0.0)
+        shares_to_match = sell_shares_total - already_matched
+        if shares_to_match <= FLOAT_TOLERANCE:
+            continue
+
+        proceeds_total = abs(_coalesce_amount(sell_row))
+        proceeds_per_share = proceeds_total / sell_shares_total if sell_shares_total else 0.0
+
+        sell_fees_total = _abs_float(sell_row["fees"])
+        sell_fee_per_share = sell_fees_total / sell_shares_total if sell_shares_total else 0.0
+        while shares_to_match > FLOAT_TOLERANCE and head < len(buy_lots):
+            lot = buy_lots[head]
+            matched_shares = min(shares_to_match, lot.shares_remaining)
+
+            allocated_cost = lot.cost_per_share * matched_shares
+            allocated_proceeds = proceeds_per_share * matched_shares
+            allocated_fees = sell_fee_per_share * matched_shares
+
+            match_rows.append(
+                (
+                    broker_id,
+                    security_id,
+                    lot.tx_id,
+                    sell_tx_id,
+                    matched_shares,
+                    allocated_cost,
+                    allocated_proceeds,
+                    allocated_fees,
+                    cost_basis_method,
+                )
+            )
+
+            lot.shares_remaining -= matched_shares
+            shares_to_match -= matched_shares
+            if lot.shares_remaining <= FLOAT_TOLERANCE:
+                head += 1
+
+        if shares_to_match > FLOAT_TOLERANCE:
+            unmatched_shares.append(shares_to_match)
+
+    return match_rows, unmatched_shares
 
 
 def create_transaction_matches(
@@ -85,9 +191,11 @@ def create_transaction_matches(
     if db_path is None:
         db_path = str(DB_PATH)
 
-    conn = sqlite3.connect(db_path)
+    conn = connect_staging_db(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
+    # One explicit transaction for the whole run, committed once at the end
+    conn.execute("BEGIN IMMEDIATE")
 
     create_broker_t(cursor)
     create_security_t(cursor)
@@ -107,26 +215,30 @@ def create_transaction_matches(
                shares, total_value, fees, net_amount
         FROM transaction_t
         WHERE {' AND '.join(where_clauses)}
-        ORDER BY broker_id, security_id, transaction_date, id
         """
     )
-    rows = cursor.fetchall()
-
-    if not rows:
-        conn.close()
-        return {"matches_created": 0, "unmatched_sell_shares": 0, "groups_processed": 0}
-
     grouped: Dict[Tuple[int, int], Dict[str, List[sqlite3.Row]]] = defaultdict(
         lambda: {"buy": [], "sell": []}
     )
-    for row in rows:
+    # Group straight off the cursor rather than materializing the result first. No
+    # ORDER BY: an IN over two types cannot be read in order from the index, and each
+    # group is sorted below anyway
+    for row in cursor:
         key = (int(row["broker_id"]), int(row["security_id"]))
         grouped[key][str(row["transaction_type"]).lower()].append(row)
 
+    if not grouped:
+        conn.commit()
+        conn.close()
+        return {"matches_created": 0, "unmatched_sell_shares": 0, "groups_processed": 0}
+
     matches_created = 0
     unmatched_sell_shares = 0.0
+    # Groups never read each other's matches, so all inserts can wait for one executemany
+    match_rows: List[Tuple] = []
 
-    for (broker_id, security_id), parts in grouped.items():
+    for broker_id, security_id in sorted(grouped):
+        parts = grouped[(broker_id, security_id)]
         buys = sorted(parts["buy"], key=lambda r: (_to_date(r["transaction_date"]), r["id"]))
         sells = sorted(parts["sell"], key=lambda r: (_to_date(r["transaction_date"]), r["id"]))
 
@@ -135,82 +247,16 @@ def create_transaction_matches(
         buy_allocations = _load_existing_allocations(cursor, "buy_transaction_id", buy_ids)
         sell_allocations = _load_existing_allocations(cursor, "sell_transaction_id", sell_ids)
 
-        buy_lots: List[BuyLot] = []
-        for buy_row in buys:
-            buy_dt = _to_date(buy_row["transaction_date"])
-            shares = _abs_float(buy_row["shares"])
-            if buy_dt is None or shares <= 0:
-                continue
-
-            cost_basis_total = abs(_coalesce_amount(buy_row))
-            cost_per_share = cost_basis_total / shares if shares else 0.0
-            allocated = buy_allocations.get(int(buy_row["id"]), 0.0)
-            shares_remaining = shares - allocated
-            if shares_remaining <= FLOAT_TOLERANCE:
-                continue
-            buy_lots.append(
-                BuyLot(
-                    tx_id=int(buy_row["id"]),
-                    buy_date=buy_dt,
-                    shares_remaining=shares_remaining,
-                    cost_per_share=cost_per_share,
-                )
-            )
-
-        for sell_row in sells:
-            sell_dt = _to_date(sell_row["transaction_date"])
-            sell_tx_id = int(sell_row["id"])
-            sell_shares_total = _abs_float(sell_row["shares"])
-            if sell_dt is None or sell_shares_total <= 0:
-                continue
-
-            already_matched = sell_allocations.get(sell_tx_id, 0.0)
-            shares_to_match = sell_shares_total - already_matched
-            if shares_to_match <= FLOAT_TOLERANCE:
-                continue
-
-            proceeds_total = abs(_coalesce_amount(sell_row))
-            proceeds_per_share = proceeds_total / sell_shares_total if sell_shares_total else 0.0
-
-            sell_fees_total = _abs_float(sell_row["fees"])
-            sell_fee_per_share = sell_fees_total / sell_shares_total if sell_shares_total else 0.0
-            while shares_to_match > FLOAT_TOLERANCE and buy_lots:
-                lot = buy_lots[0]
-                matched_shares = min(shares_to_match, lot.shares_remaining)
-
-                allocated_cost = lot.cost_per_share * matched_shares
-                allocated_proceeds = proceeds_per_share * matched_shares
-                allocated_fees = sell_fee_per_share * matched_shares
-
-                cursor.execute(
-                    """
-                    INSERT INTO transaction_match_t
-                    (broker_id, security_id, buy_transaction_id, sell_transaction_id,
-                     shares, allocated_cost, allocated_proceeds, allocated_fees, cost_basis_method)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        broker_id,
-                        security_id,
-                        lot.tx_id,
-                        sell_tx_id,
-                        matched_shares,
-                        allocated_cost,
-                        allocated_proceeds,
-                        allocated_fees,
-                        cost_basis_method,
-                    ),
-                )
-                matches_created += 1
-
-                lot.shares_remaining -= matched_shares
-                shares_to_match -= matched_shares
-                if lot.shares_remaining <= FLOAT_TOLERANCE:
-                    buy_lots.pop(0)
-
-            if shares_to_match > FLOAT_TOLERANCE:
-                unmatched_sell_shares += shares_to_match
+        group_rows, unmatched_shares = _match_group(
+            broker_id, security_id, buys, sells,
+            buy_allocations, sell_allocations, cost_basis_method,
+        )
+        match_rows.extend(group_rows)
+        matches_created += len(group_rows)
+        for shares in unmatched_shares:
+            unmatched_sell_shares += shares
 
+    cursor.executemany(INSERT_MATCH_SQL, match_rows)
     conn.commit()
     conn.close()
 
@@ -8,11 +8,12 @@ import sqlite3
 import sys
 from pathlib import Path
 
-from typing import Optional
+from typing import Iterable, Optional
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 from configuration import DB_PATH, LOADER_LOG_PATH
+from src.repository.connection import connect_staging_db
 from src.repository.create_db import create_market_price_t
 from src.repository.security_repository import get_or_create_security
 
@@ -26,6 +27,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Names per IN (...) clause, well below SQLite's 999 bound parameters
+SQL_BATCH_SIZE = 500
+
 
 def _normalize_asset_type(value: str | None) -> str | None:
     if value is None:
@@ -34,21 +38,38 @@ def _normalize_asset_type(value: str | None) -> str | None:
     return normalized or None
 
 
-def _get_asset_type(
+def _resolve_securities(
     cursor: sqlite3.Cursor,
-    security_id: int,
-    cache: dict[int, Optional[str]],
-) -> Optional[str]:
-    if security_id in cache:
-        return cache[security_id]
-    cursor.execute("SELECT asset_type FROM security_t WHERE id = ?", (security_id,))
-    row = cursor.fetchone()
-    asset_type = _normalize_asset_type(row[0]) if row and row[0] else None
-    cache[security_id] = asset_type
-    return asset_type
-
-
-def fetch_open_positions(cursor: sqlite3.Cursor) -> list[dict]:
+    security_names: Iterable[str],
+) -> dict[str, tuple[int, Optional[str]]]:
+    """Map security names to (security_id, asset_type), creating unknown securities."""
+    securities: dict[str, tuple[int, Optional[str]]] = {}
+    # Deduplicate in first-seen order so new securities get ids in file order
+    names = list(dict.fromkeys(security_names))
+    for start in range(0, len(names), SQL_BATCH_SIZE):
+        chunk = names[start:start + SQL_BATCH_SIZE]
+        cursor.execute(
+            f"""
+            SELECT security_name, id, asset_type
+            FROM security_t
+            WHERE security_name IN ({','.join('?' * len(chunk))})
+            ORDER BY id
+            """,
+            chunk,
+        )
+        # Duplicate names resolve to the oldest row, as the one-by-one lookup did
+        for security_name, security_id, asset_type in cursor.fetchall():
+            securities.setdefault(security_name, (security_id, _normalize_asset_type(asset_type)))
+
+    # New securities are rare after the first import; create them one by one
+    for security_name in names:
+        if security_name not in securities:
+            securities[security_name] = (get_or_create_security(cursor, security_name), None)
+    return securities
+
+
+def fetch_open_positions(cursor: sqlite3.Cursor) -> list[tuple]:
+    """Return unprocessed (security_name, share_price, position_date) rows."""
     cursor.execute(
         """
         SELECT
@@ -59,23 +80,17 @@ def fetch_open_positions(cursor: sqlite3.Cursor) -> list[dict]:
         WHERE processed = 0
         """
     )
-    rows = cursor.fetchall()
-    return [
-        {
-            "security_name": row[0],
-            "share_price": row[1],
-            "position_date": row[2],
-        }
-        for row in rows
-    ]
+    return cursor.fetchall()
 
 
 def load_market_prices(db_path: str | None = None) -> None:
     if db_path is None:
         db_path = str(DB_PATH)
 
-    conn = sqlite3.connect(db_path)
+    conn = connect_staging_db(db_path)
     cursor = conn.cursor()
+    # One explicit transaction for the whole run, committed once at the end
+    conn.execute("BEGIN IMMEDIATE")
 
     create_market_price_t(cursor)
 
@@ -83,36 +98,40 @@ def load_market_prices(db_path: str | None = None) -> None:
     if not positions:
         logger.info("No new open positions to process.")
         print("No new open positions to process.")
+        conn.commit()
+        conn.close()
         return
 
-    asset_type_cache: dict[int, Optional[str]] = {}
-    inserted = 0
-    for position in positions:
-        security_id = get_or_create_security(cursor, position["security_name"])
-        share_price = position["share_price"]
-        price_date = position["position_date"]
+    securities = _resolve_securities(cursor, (security_name for security_name, _, _ in positions))
+    price_rows = []
+    for security_name, share_price, price_date in positions:
+        security_id, asset_type = securities[security_name]
 
         if share_price is None or price_date is None:
-            logger.warning("Skipping position with missing price/date: %s", position)
+            logger.warning(
+                "Skipping position with missing price/date: %s (%s, %s)",
+                security_name,
+                share_price,
+                price_date,
+            )
             continue
 
-        asset_type = _get_asset_type(cursor, security_id, asset_type_cache)
         normalized_price = float(share_price)
         if asset_type == "bond":
             normalized_price /= 100.0
+        price_rows.append((security_id, normalized_price, price_date))
 
-        cursor.execute(
-            """
-            INSERT INTO market_price_t (security_id, share_price, price_date)
-            VALUES (?, ?, ?)
-            ON CONFLICT(security_id, price_date) DO UPDATE SET
-                share_price = excluded.share_price,
-                created_at = CURRENT_TIMESTAMP
-            """,
-            (security_id, normalized_price, price_date),
-        )
-
-        inserted += 1
+    cursor.executemany(
+        """
+        INSERT INTO market_price_t (security_id, share_price, price_date)
+        VALUES (?, ?, ?)
+        ON CONFLICT(security_id, price_date) DO UPDATE SET
+            share_price = excluded.share_price,
+            created_at = CURRENT_TIMESTAMP
+        """,
+        price_rows,
+    )
+    inserted = len(price_rows)
 
     cursor.execute("UPDATE open_position_staging_t SET processed = 1 WHERE processed = 0")
     conn.commit()
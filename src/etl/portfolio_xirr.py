@@ -7,13 +7,19 @@ import csv
 import logging
 import math
 import sqlite3
+import struct
 from collections import defaultdict
+from contextlib import closing
+from dataclasses import dataclass
 from datetime import date, datetime
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 import sys
 
+import numpy as np
+
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
@@ -32,7 +38,12 @@ logger = logging.getLogger(__name__)
 OUTFLOW_TYPES = {"buy"}
 INFLOW_TYPES = {"sell", "dividend", "interest", "distribution"}
 FLOAT_TOLERANCE = 1e-9
-SQLITE_PARAM_LIMIT = 999
+# Cap on root-search steps once a sign-change bracket is found (the old bisection's cap)
+ROOT_MAX_ITERATIONS = 200
+# Same-sign brackets whose ends are further apart than this are bisected in bit order
+GEOMETRIC_BISECTION_RATIO = 1e3
+# Memory map for the XIRR read connections
+MMAP_SIZE = 256 * 1024 * 1024
 
 BRACKET_SCAN_POINTS = (
     -0.9999,
@@ -73,16 +84,33 @@ BRACKET_SCAN_POINTS = (
     100_000.0,
     1_000_000.0,
 )
+BRACKET_SCAN_RATES = np.array(BRACKET_SCAN_POINTS, dtype=np.float64)
+# Upper bounds tried before the scan: 0.1, doubled until it passes 1e6
+BRACKET_DOUBLING_RATES = 0.1 * 2.0 ** np.arange(25)
+
+
+@dataclass(slots=True)
+class OpenPosition:
+    security_name: str
+    net_shares: float = 0.0
+    last_price: float | None = None
+    last_price_date: date | None = None
 
 
+@lru_cache(maxsize=4096)
 def _to_date(value: str | datetime | date | None) -> date | None:
-    """Convert SQLite date/text values to ``date`` objects."""
+    """Convert SQLite date/text values to ``date`` objects (cached; dates repeat a lot)."""
     if value is None:
         return None
     if isinstance(value, date) and not isinstance(value, datetime):
         return value
     if isinstance(value, datetime):
         return value.date()
+    try:
+        # Plain dates parse straight to ``date``; timestamps take the datetime route
+        return date.fromisoformat(value)  # type: ignore[arg-type]
+    except ValueError:
+        pass
     try:
         return datetime.fromisoformat(value).date()  # type: ignore[arg-type]
     except ValueError as exc:  # pragma: no cover - defensive guard
@@ -90,6 +118,27 @@ def _to_date(value: str | datetime | date | None) -> date | None:
         return None
 
 
+def _open_conn(db_path: str) -> sqlite3.Connection:
+    """Open a read connection to ``db_path`` with the XIRR tables in place.
+
+    Each XIRR call opens its own connection and closes it once the rows are
+    fetched, so no handle outlives the call: the loaders can replace or delete
+    the database file (which Windows refuses while it is open) and the
+    dashboard's script threads never share a connection. The journal mode is
+    left as the loaders set it.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    cursor = conn.cursor()
+    create_security_t(cursor)
+    create_transaction_t(cursor)
+    create_transaction_match_t(cursor)
+    create_dividend_allocation_t(cursor)
+    create_market_price_t(cursor)
+    return conn
+
+
 def _coalesce_amount(row: sqlite3.Row, prefer_net: bool = True) -> float:
     """Return the best available monetary value for a transaction."""
     if prefer_net and row["net_amount"] is not None:
@@ -111,40 +160,77 @@ def _normalize_cashflow(amount: float, tx_type: str | None) -> float:
     return amount
 
 
+def _bracket_midpoint(low: float, high: float) -> float:
+    """Bisection point of a sign-change bracket, used when a Newton step is rejected.
+
+    Brackets are bisected by value. Only a bracket on one side of zero whose ends
+    are orders of magnitude apart (say 0.1 to 1e6) is split at the midpoint in
+    float64 bit order, which narrows the ratio of the ends instead of the width.
+    """
+    if low > 0 or high < 0:
+        ratio = high / low if low > 0 else low / high
+        if ratio > GEOMETRIC_BISECTION_RATIO:
+            return _float_midpoint(low, high)
+    return low + (high - low) / 2
+
+
+def _float_midpoint(low: float, high: float) -> float:
+    """Midpoint of ``low`` and ``high`` in float64 bit order rather than by value.
+
+    Halving the gap between the bit patterns reaches adjacent floats after at
+    most 64 bisections, however wide the bracket.
+    """
+    low_key = _ordered_bits(low)
+    return _from_ordered_bits(low_key + (_ordered_bits(high) - low_key) // 2)
+
+
+def _ordered_bits(value: float) -> int:
+    # Map the float64 bit pattern onto integers that sort like the floats do
+    bits = struct.unpack("<q", struct.pack("<d", value))[0]
+    return bits if bits >= 0 else -(bits & 0x7FFF_FFFF_FFFF_FFFF)
+
+
+def _from_ordered_bits(key: int) -> float:
+    bits = key if key >= 0 else -key | -0x8000_0000_0000_0000
+    return struct.unpack("<d", struct.pack("<q", bits))[0]
+
+
 def _xirr_from_cashflows(cashflows: List[Tuple[date, float]]) -> float | None:
-    """Compute XIRR for dated cashflows using a bounded bisection search."""
+    """Compute XIRR for dated cashflows using a bracketed Newton-Raphson search."""
     if len(cashflows) < 2:
         return None
-    has_positive = any(amount > 0 for _, amount in cashflows)
-    has_negative = any(amount < 0 for _, amount in cashflows)
-    if not (has_positive and has_negative):
+    amounts = np.fromiter(
+        (amount for _, amount in cashflows), dtype=np.float64, count=len(cashflows)
+    )
+    # Both signs must be present, checked on the array rather than the list
+    if not ((amounts > 0).any() and (amounts < 0).any()):
         return None
 
-    start_date = cashflows[0][0]
-    timed_flows = [
-        ((flow_date - start_date).days / 365.25, amount)
-        for flow_date, amount in cashflows
-    ]
-
-    def npv(rate: float) -> float:
-        factor = 1.0 + rate
-        if factor <= 0:
-            return math.copysign(math.inf, factor)
-        total = 0.0
-        for years, amount in timed_flows:
-            total += amount / (factor ** years)
-        return total
-
+    # Day offsets from the first flow in one datetime64 subtraction
+    flow_dates = np.array([flow_date for flow_date, _ in cashflows], dtype="datetime64[D]")
+    years = (flow_dates - flow_dates[0]).astype(np.int64) / 365.25
+
+    # amount / (1 + rate) ** years == amount * exp(-log1p(rate) * years): one log
+    # per rate and an exp per flow instead of a pow per flow
+    def npv_many(rates: np.ndarray) -> np.ndarray:
+        # Extreme rates overflow/underflow the discount factor; the caller's
+        # finiteness checks handle the resulting inf/NaN
+        with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+            log_factors = np.log1p(rates)[:, np.newaxis]
+            return (amounts * np.exp(-log_factors * years)).sum(axis=1)
+
+    def npv_with_slope(rate: float) -> Tuple[float, float]:
+        # Called inside the root search's errstate block, not one per call
+        discounted = amounts * np.exp(-math.log1p(rate) * years)
+        return float(discounted.sum()), float(-(years @ discounted) / (1.0 + rate))
+
+    # Evaluate the bracket candidates in one broadcast instead of one NPV call each
     low = -0.9999
-    high = 0.1
-    npv_low = npv(low)
-    npv_high = npv(high)
-
-    attempts = 0
-    while npv_low * npv_high > 0 and attempts < 60 and high < 1e6:
-        high *= 2
-        npv_high = npv(high)
-        attempts += 1
+    npv_low, *doubling_values = npv_many(np.concatenate(([low], BRACKET_DOUBLING_RATES))).tolist()
+    # Take the first upper bound where the NPV changes sign (or turns NaN)
+    for high, npv_high in zip(BRACKET_DOUBLING_RATES.tolist(), doubling_values):
+        if not npv_low * npv_high > 0:
+            break
 
     if not (math.isfinite(npv_low) and math.isfinite(npv_high)):
         return None
@@ -152,8 +238,7 @@ def _xirr_from_cashflows(cashflows: List[Tuple[date, float]]) -> float | None:
     if npv_low * npv_high > 0:
         prev_rate = None
         prev_val = None
-        for rate in BRACKET_SCAN_POINTS:
-            val = npv(rate)
+        for rate, val in zip(BRACKET_SCAN_POINTS, npv_many(BRACKET_SCAN_RATES).tolist()):
             if not math.isfinite(val):
                 continue
             if abs(val) < 1e-7:
@@ -169,21 +254,43 @@ def _xirr_from_cashflows(cashflows: List[Tuple[date, float]]) -> float | None:
         else:
             return None
 
-    for _ in range(200):
-        mid = (low + high) / 2
-        npv_mid = npv(mid)
-        if not math.isfinite(npv_mid):
-            return None
-        if abs(npv_mid) < 1e-7:
-            return mid
-        if npv_low * npv_mid < 0:
-            high = mid
-            npv_high = npv_mid
-        else:
-            low = mid
-            npv_low = npv_mid
-
-    return (low + high) / 2
+    # Safeguarded Newton (rtsafe): the Newton step is taken while it stays inside
+    # the sign-change bracket and is under half the step before last; otherwise the
+    # bracket is bisected. Either way the search continues from the new point
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        rate = _bracket_midpoint(low, high)
+        step = previous_step = high - low
+        for _ in range(ROOT_MAX_ITERATIONS):
+            value, slope = npv_with_slope(rate)
+            if not math.isfinite(value):
+                return None
+            if abs(value) < 1e-7:
+                return rate
+            if npv_low * value < 0:
+                high = rate
+            else:
+                low = rate
+                npv_low = value
+            if math.nextafter(low, high) >= high:
+                # Adjacent floats: the root is pinned down as far as float64 allows
+                return rate
+            newton_step = value / slope if slope != 0 and math.isfinite(slope) else math.nan
+            newton_rate = rate - newton_step
+            if low < newton_rate < high and abs(newton_step) < abs(previous_step) / 2:
+                previous_step, step = step, newton_step
+                rate = newton_rate
+            else:
+                midpoint = _bracket_midpoint(low, high)
+                previous_step, step = step, rate - midpoint
+                rate = midpoint
+
+    logger.warning(
+        "XIRR root search did not converge within %d steps (bracket %r to %r)",
+        ROOT_MAX_ITERATIONS,
+        low,
+        high,
+    )
+    return None
 
 
 def calculate_portfolio_xirr(
@@ -199,84 +306,69 @@ def calculate_portfolio_xirr(
     if asset_type_filter is not None and asset_type_filter.lower() == "all":
         asset_type_filter = None
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    create_security_t(cursor)
-    create_transaction_t(cursor)
-    create_dividend_allocation_t(cursor)
-    create_market_price_t(cursor)
-
     asset_filter_clause = ""
-    dividend_filter_clause = ""
-    params: Tuple[str, ...] = ()
+    params: Dict[str, str] = {}
     if asset_type_filter:
         asset_filter_clause = """
-          AND s.asset_type IS NOT NULL
-          AND LOWER(s.asset_type) = LOWER(?)
-        """
-        dividend_filter_clause = """
           AND sec.asset_type IS NOT NULL
-          AND LOWER(sec.asset_type) = LOWER(?)
+          AND LOWER(sec.asset_type) = LOWER(:asset_type)
         """
-        params = (asset_type_filter,)
-    dividend_params = params
-
-    cursor.execute(
-        f"""
-         SELECT t.security_id, t.transaction_date, t.transaction_type, t.net_amount, t.total_value,
-             t.price_per_share, t.shares, s.security_name
-        FROM transaction_t t
-        JOIN security_t s ON s.id = t.security_id
-        WHERE t.transaction_date IS NOT NULL
-          AND LOWER(COALESCE(t.transaction_type, '')) <> 'dividend'
-        {asset_filter_clause}
-        ORDER BY t.transaction_date, t.id
-        """,
-        params,
-    )
-    rows = cursor.fetchall()
-    cursor.execute(
-        f"""
-        SELECT da.allocated_amount,
-               div_tx.transaction_date AS dividend_date,
-               sec.security_name,
-               sec.id AS security_id
-        FROM dividend_allocation_t da
-        JOIN transaction_t div_tx ON div_tx.id = da.dividend_transaction_id
-        JOIN security_t sec ON sec.id = da.security_id
-        WHERE div_tx.transaction_date IS NOT NULL
-          AND COALESCE(div_tx.allocated, 0) = 1
-        {dividend_filter_clause}
-        ORDER BY div_tx.transaction_date, da.id
-        """,
-        dividend_params,
-    )
-    dividend_rows = cursor.fetchall()
+        params = {"asset_type": asset_type_filter}
+
+    # Names are looked up once per security rather than carried on every row
+    scoped_securities = f"SELECT sec.id FROM security_t sec WHERE 1 = 1 {asset_filter_clause}"
+    with closing(_open_conn(db_path)) as conn:
+        security_names: Dict[int, str | None] = {
+            security_id: security_name
+            for security_id, security_name in conn.execute(
+                f"SELECT sec.id, sec.security_name FROM security_t sec WHERE 1 = 1 {asset_filter_clause}",
+                params,
+            )
+        }
 
-    cursor.execute(
-        f"""
-        WITH latest_price AS (
-            SELECT security_id, MAX(price_date) AS price_date
-            FROM market_price_t
-            GROUP BY security_id
-        )
-        SELECT mp.security_id,
-               mp.share_price,
-               mp.price_date
-        FROM market_price_t mp
-        JOIN latest_price lp
-          ON lp.security_id = mp.security_id
-         AND lp.price_date = mp.price_date
-        JOIN security_t sec ON sec.id = mp.security_id
-        WHERE 1 = 1
-        {dividend_filter_clause}
-        """,
-        dividend_params,
-    )
-    market_price_rows = cursor.fetchall()
-    conn.close()
+        # Transactions and allocated dividends in one pass; within a date the
+        # transactions come first, as when the two were fetched separately
+        rows = conn.execute(
+            f"""
+            SELECT 0 AS is_dividend, t.id AS row_id, t.security_id, t.transaction_date,
+                   t.transaction_type, t.net_amount, t.total_value, t.price_per_share, t.shares,
+                   NULL AS allocated_amount
+            FROM transaction_t t
+            WHERE t.transaction_date IS NOT NULL
+              AND LOWER(COALESCE(t.transaction_type, '')) <> 'dividend'
+              AND t.security_id IN ({scoped_securities})
+            UNION ALL
+            SELECT 1, da.id, da.security_id, div_tx.transaction_date,
+                   'dividend', NULL, NULL, NULL, NULL,
+                   da.allocated_amount
+            FROM dividend_allocation_t da
+            JOIN transaction_t div_tx ON div_tx.id = da.dividend_transaction_id
+            WHERE div_tx.transaction_date IS NOT NULL
+              AND COALESCE(div_tx.allocated, 0) = 1
+              AND da.security_id IN ({scoped_securities})
+            ORDER BY transaction_date, is_dividend, row_id
+            """,
+            params,
+        ).fetchall()
+
+        market_price_rows = conn.execute(
+            f"""
+            WITH latest_price AS (
+                SELECT security_id, MAX(price_date) AS price_date
+                FROM market_price_t
+                GROUP BY security_id
+            )
+            SELECT mp.security_id,
+                   mp.share_price,
+                   mp.price_date
+            FROM market_price_t mp
+            JOIN latest_price lp
+              ON lp.security_id = mp.security_id
+             AND lp.price_date = mp.price_date
+            WHERE mp.security_id IN ({scoped_securities})
+            """,
+            params,
+        ).fetchall()
 
     market_prices: Dict[int, Tuple[float, date | None]] = {}
     for row in market_price_rows:
@@ -289,21 +381,24 @@ def calculate_portfolio_xirr(
         )
 
     scope_label = asset_type_filter or "all asset types"
-    if not rows:
-        logger.info("No %s transactions available for XIRR", scope_label)
-        return None
-
     cashflows: Dict[date, float] = defaultdict(float)
     cashflow_details: List[Tuple[date, float, str, str]] = []
-    open_positions: Dict[int, Dict[str, float | date | None | str]] = defaultdict(
-        lambda: {
-            "net_shares": 0.0,
-            "last_price": None,
-            "last_price_date": None,
-            "security_name": None,
-        }
-    )
+    open_positions: Dict[int, OpenPosition] = {}
+    transaction_count = 0
     for row in rows:
+        if row["is_dividend"]:
+            div_date = _to_date(row["transaction_date"])
+            if div_date is None:
+                continue
+            amount = float(row["allocated_amount"] or 0.0)
+            if amount == 0.0:
+                continue
+            security_name = security_names.get(row["security_id"]) or f"Security {row['security_id']}"
+            cashflows[div_date] += amount
+            cashflow_details.append((div_date, amount, security_name, "dividend"))
+            continue
+
+        transaction_count += 1
         tx_date = _to_date(row["transaction_date"])
         if tx_date is None:
             continue
@@ -312,19 +407,20 @@ def calculate_portfolio_xirr(
         if amount == 0.0:
             continue
         cashflows[tx_date] += amount
-        security_name = row["security_name"] or f"Security {row['security_id']}"
+        security_name = security_names.get(row["security_id"]) or f"Security {row['security_id']}"
         tx_type = (row["transaction_type"] or "").strip().lower()
         cashflow_details.append((tx_date, amount, security_name, tx_type or "unknown"))
         shares = float(row["shares"] or 0.0)
         shares_abs = abs(shares)
         if tx_type in ("buy", "sell") and shares_abs > FLOAT_TOLERANCE:
-            position = open_positions[int(row["security_id"])]
-            if not position["security_name"]:
-                position["security_name"] = security_name
+            security_id = int(row["security_id"])
+            position = open_positions.get(security_id)
+            if position is None:
+                position = open_positions[security_id] = OpenPosition(security_name)
             if tx_type == "buy":
-                position["net_shares"] = float(position["net_shares"] or 0.0) + shares_abs
+                position.net_shares += shares_abs
             else:
-                position["net_shares"] = float(position["net_shares"] or 0.0) - shares_abs
+                position.net_shares -= shares_abs
 
             price = None
             if shares_abs > FLOAT_TOLERANCE:
@@ -332,28 +428,21 @@ def calculate_portfolio_xirr(
             if (price is None or price <= FLOAT_TOLERANCE) and row["price_per_share"] is not None:
                 price = float(row["price_per_share"])
             if price is not None:
-                last_date = position["last_price_date"]
+                last_date = position.last_price_date
                 if last_date is None or tx_date >= last_date:
-                    position["last_price"] = float(price)
-                    position["last_price_date"] = tx_date
+                    position.last_price = float(price)
+                    position.last_price_date = tx_date
+
+    if not transaction_count:
+        logger.info("No %s transactions available for XIRR", scope_label)
+        return None
 
-    for row in dividend_rows:
-        div_date = _to_date(row["dividend_date"])
-        if div_date is None:
-            continue
-        amount = float(row["allocated_amount"] or 0.0)
-        if amount == 0.0:
-            continue
-        security_name = row["security_name"] or f"Security {row['security_id']}"
-        cashflows[div_date] += amount
-        cashflow_details.append((div_date, amount, security_name, "dividend"))
-        
     open_valuation_entries: List[Tuple[str, float]] = []
     for security_id, position in open_positions.items():
-        net_shares = float(position["net_shares"] or 0.0)
+        net_shares = position.net_shares
         if abs(net_shares) <= FLOAT_TOLERANCE:
             continue
-        last_price = position["last_price"]
+        last_price = position.last_price
         preferred_price = None
         market_price_entry = market_prices.get(security_id)
         if market_price_entry is not None:
@@ -362,7 +451,7 @@ def calculate_portfolio_xirr(
             preferred_price = float(last_price)
         if preferred_price is None:
             continue
-        security_name = position.get("security_name") or f"Security {security_id}"
+        security_name = position.security_name
         open_value = net_shares * float(preferred_price)
         if abs(open_value) <= FLOAT_TOLERANCE:
             continue
@@ -406,33 +495,17 @@ def calculate_portfolio_xirr_closed_positions(
     if asset_type_filter is not None and asset_type_filter.lower() == "all":
         asset_type_filter = None
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    create_security_t(cursor)
-    create_transaction_t(cursor)
-    create_transaction_match_t(cursor)
-    create_dividend_allocation_t(cursor)
-
     asset_filter_clause = ""
-    params: Tuple[str, ...] = ()
+    params: Dict[str, str] = {}
     if asset_type_filter:
         asset_filter_clause = """
           AND sec.asset_type IS NOT NULL
-          AND LOWER(sec.asset_type) = LOWER(?)
+          AND LOWER(sec.asset_type) = LOWER(:asset_type)
         """
-        params = (asset_type_filter,)
+        params = {"asset_type": asset_type_filter}
 
-    cursor.execute(
-        f"""
-        SELECT tm.buy_transaction_id,
-               tm.sell_transaction_id,
-               tm.allocated_cost,
-               tm.allocated_proceeds,
-               bt.transaction_date AS buy_date,
-               st.transaction_date AS sell_date,
-               sec.security_name
+    # Matched lots scoped to the asset filter; dividends count only for these buys
+    matched_lots = f"""
         FROM transaction_match_t tm
         JOIN transaction_t bt ON bt.id = tm.buy_transaction_id
         JOIN transaction_t st ON st.id = tm.sell_transaction_id
@@ -440,23 +513,92 @@ def calculate_portfolio_xirr_closed_positions(
         WHERE bt.transaction_date IS NOT NULL
           AND st.transaction_date IS NOT NULL
         {asset_filter_clause}
-        ORDER BY bt.transaction_date, tm.id
-        """,
-        params,
-    )
-    match_rows = cursor.fetchall()
+    """
+    matched_dividends = f"""
+        FROM dividend_allocation_t da
+        JOIN transaction_t div_tx ON div_tx.id = da.dividend_transaction_id
+        JOIN security_t sec ON sec.id = da.security_id
+        WHERE div_tx.transaction_date IS NOT NULL
+        {asset_filter_clause}
+          AND da.buy_transaction_id IN (
+              SELECT tm.buy_transaction_id
+              {matched_lots}
+          )
+    """
 
     scope_label = asset_type_filter or "all asset types"
-    if not match_rows:
-        logger.info("No matched BUY/SELL lots available for XIRR (%s)", scope_label)
-        conn.close()
-        return None
+    with closing(_open_conn(db_path)) as conn:
+        has_matches = conn.execute(f"SELECT EXISTS (SELECT 1 {matched_lots})", params).fetchone()[0]
+        if not has_matches:
+            logger.info("No matched BUY/SELL lots available for XIRR (%s)", scope_label)
+            return None
+
+        # Net the flows per date in SQLite; only one row per date reaches Python
+        flow_rows = conn.execute(
+            f"""
+            SELECT flow_date, SUM(amount) AS amount
+            FROM (
+                SELECT bt.transaction_date AS flow_date, -ABS(tm.allocated_cost) AS amount
+                {matched_lots}
+                  AND ABS(COALESCE(tm.allocated_cost, 0)) > :tolerance
+                UNION ALL
+                SELECT st.transaction_date, tm.allocated_proceeds
+                {matched_lots}
+                  AND ABS(COALESCE(tm.allocated_proceeds, 0)) > :tolerance
+                UNION ALL
+                SELECT div_tx.transaction_date, da.allocated_amount
+                {matched_dividends}
+                  AND ABS(COALESCE(da.allocated_amount, 0)) > :tolerance
+            )
+            GROUP BY flow_date
+            """,
+            {**params, "tolerance": FLOAT_TOLERANCE},
+        ).fetchall()
+        cashflows: Dict[date, float] = defaultdict(float)
+        for flow_date, amount in flow_rows:
+            cashflow_date = _to_date(flow_date)
+            if cashflow_date is not None:
+                cashflows[cashflow_date] += amount
+
+        if not cashflows:
+            logger.info("No valid cash flows found for matched-lot XIRR (%s)", scope_label)
+            return None
+
+        if debug:
+            if debug_csv_path:
+                # The per-row flows are only fetched for the debug export
+                _write_cashflow_debug_csv(
+                    debug_csv_path,
+                    _matched_cashflow_details(conn, matched_lots, matched_dividends, params),
+                )
+            else:
+                logger.warning("Debug flag enabled but no CSV path provided; skipping export")
+
+    ordered_cashflows = sorted(cashflows.items(), key=lambda item: item[0])
+    return _xirr_from_cashflows(ordered_cashflows)
 
-    cashflows: Dict[date, float] = defaultdict(float)
-    cashflow_details: List[Tuple[date, float, str, str]] = []
-    matched_buy_ids: List[int] = []
-    seen_buy_ids: set[int] = set()
 
+def _matched_cashflow_details(
+    conn: sqlite3.Connection,
+    matched_lots: str,
+    matched_dividends: str,
+    params: Dict[str, str],
+) -> List[Tuple[date, float, str, str]]:
+    """Return the per-lot and per-dividend flows behind the matched-lot XIRR."""
+    cashflow_details: List[Tuple[date, float, str, str]] = []
+    match_rows = conn.execute(
+        f"""
+        SELECT tm.buy_transaction_id,
+               tm.allocated_cost,
+               tm.allocated_proceeds,
+               bt.transaction_date AS buy_date,
+               st.transaction_date AS sell_date,
+               sec.security_name
+        {matched_lots}
+        ORDER BY bt.transaction_date, tm.id
+        """,
+        params,
+    ).fetchall()
     for row in match_rows:
         buy_date = _to_date(row["buy_date"])
         sell_date = _to_date(row["sell_date"])
@@ -467,77 +609,32 @@ def calculate_portfolio_xirr_closed_positions(
 
         cost = float(row["allocated_cost"] or 0.0)
         if abs(cost) > FLOAT_TOLERANCE:
-            outflow = -abs(cost)
-            cashflows[buy_date] += outflow
-            cashflow_details.append((buy_date, outflow, security_name, "buy"))
+            cashflow_details.append((buy_date, -abs(cost), security_name, "buy"))
 
         proceeds = float(row["allocated_proceeds"] or 0.0)
         if abs(proceeds) > FLOAT_TOLERANCE:
-            cashflows[sell_date] += proceeds
             cashflow_details.append((sell_date, proceeds, security_name, "sell"))
 
-        buy_id = int(row["buy_transaction_id"])
-        if buy_id not in seen_buy_ids:
-            matched_buy_ids.append(buy_id)
-            seen_buy_ids.add(buy_id)
-
-    dividend_filter_clause = ""
-    if asset_type_filter:
-        dividend_filter_clause = """
-          AND sec.asset_type IS NOT NULL
-          AND LOWER(sec.asset_type) = LOWER(?)
-        """
-
-    if matched_buy_ids:
-        buy_id_list = sorted(matched_buy_ids)
-        param_overhead = 1 if asset_type_filter else 0
-        chunk_limit = max(1, SQLITE_PARAM_LIMIT - param_overhead)
-        dividend_rows: List[sqlite3.Row] = []
-        for start in range(0, len(buy_id_list), chunk_limit):
-            chunk = buy_id_list[start : start + chunk_limit]
-            placeholders = ",".join(["?"] * len(chunk))
-            cursor.execute(
-                f"""
-                SELECT da.allocated_amount,
-                       div_tx.transaction_date AS dividend_date,
-                       sec.security_name
-                FROM dividend_allocation_t da
-                JOIN transaction_t div_tx ON div_tx.id = da.dividend_transaction_id
-                JOIN security_t sec ON sec.id = da.security_id
-                WHERE div_tx.transaction_date IS NOT NULL
-                {dividend_filter_clause}
-                  AND da.buy_transaction_id IN ({placeholders})
-                """,
-                ((asset_type_filter,) if asset_type_filter else ()) + tuple(chunk),
-            )
-            dividend_rows.extend(cursor.fetchall())
-
-        for row in dividend_rows:
-            div_date = _to_date(row["dividend_date"])
-            if div_date is None:
-                continue
-            amount = float(row["allocated_amount"] or 0.0)
-            if abs(amount) <= FLOAT_TOLERANCE:
-                continue
-            security_name = row["security_name"] or "Dividend"
-            cashflows[div_date] += amount
-            cashflow_details.append(
-                (div_date, amount, security_name, "dividend")
-            )
-
-    conn.close()
-
-    if not cashflows:
-        logger.info("No valid cash flows found for matched-lot XIRR (%s)", scope_label)
-        return None
-
-    ordered_cashflows = sorted(cashflows.items(), key=lambda item: item[0])
-    if debug:
-        if debug_csv_path:
-            _write_cashflow_debug_csv(debug_csv_path, cashflow_details)
-        else:
-            logger.warning("Debug flag enabled but no CSV path provided; skipping export")
-    return _xirr_from_cashflows(ordered_cashflows)
+    dividend_rows = conn.execute(
+        f"""
+        SELECT da.allocated_amount,
+               div_tx.transaction_date AS dividend_date,
+               sec.security_name
+        {matched_dividends}
+        ORDER BY da.buy_transaction_id
+        """,
+        params,
+    ).fetchall()
+    for row in dividend_rows:
+        div_date = _to_date(row["dividend_date"])
+        if div_date is None:
+            continue
+        amount = float(row["allocated_amount"] or 0.0)
+        if abs(amount) <= FLOAT_TOLERANCE:
+            continue
+        security_name = row["security_name"] or "Dividend"
+        cashflow_details.append((div_date, amount, security_name, "dividend"))
+    return cashflow_details
 
 
 def _write_cashflow_debug_csv(
@@ -0,0 +1,43 @@
+"""
+SQLite connection setup shared by the loader scripts and the ETLs.
+"""
+
+import sqlite3
+
+# Seconds a connection waits for another loader's write transaction to finish;
+# load_all runs one loader per file and a large export holds the lock for a while
+BUSY_TIMEOUT_SECONDS = 600
+
+
+def connect_staging_db(db_path: str, fast: bool = False) -> sqlite3.Connection:
+    """
+    Open a connection tuned for bulk staging loads and ETL runs.
+
+    Args:
+        db_path: Path to the SQLite database
+        fast: Drop the journal and fsyncs entirely. Only meant for initial
+            loads into a database that can be rebuilt: a crash mid-load may
+            corrupt it and a failed load cannot be rolled back. Call
+            restore_journal() once the load is done, also when it fails.
+    """
+    # Autocommit mode with explicit BEGIN/COMMIT around the inserts; the
+    # larger statement cache keeps the INSERT plans prepared
+    conn = sqlite3.connect(
+        db_path, isolation_level=None, cached_statements=256, timeout=BUSY_TIMEOUT_SECONDS
+    )
+    if fast:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+    else:
+        # WAL with synchronous=NORMAL avoids an fsync per write for bulk loads
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")  # 64 MiB page cache
+    return conn
+
+
+def restore_journal(conn: sqlite3.Connection) -> None:
+    """Switch a fast-mode connection back to the durable WAL settings."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
@@ -158,6 +158,12 @@ def create_transaction_t(cursor: sqlite3.Cursor):
         """
     )
 
+    # Lets the ETLs read one transaction type in (broker, security, date) order without a sort
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transaction_type_broker_security_date"
+        " ON transaction_t (transaction_type, broker_id, security_id, transaction_date)"
+    )
+
 
 def create_market_price_t(cursor: sqlite3.Cursor):
     """Create market_price_t table if it doesn't exist."""
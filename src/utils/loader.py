@@ -0,0 +1,133 @@
+"""
+Shared helpers for the staging loader scripts.
+"""
+
+import codecs
+import importlib.util
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Bytes inspected to pick the encoding before parsing the file
+SNIFF_BYTES = 64 * 1024
+
+# pyarrow is optional; when installed it can parse an export multi-threaded
+PYARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+# Conservative bound on bound parameters per multi-row INSERT statement
+SQLITE_MAX_VARIABLES = 999
+
+
+def sniff_encodings(filepath: str, encodings: list[str]) -> list[str]:
+    """Encodings that decode the first SNIFF_BYTES of the file, in preference order."""
+    with open(filepath, 'rb') as f:
+        prefix = f.read(SNIFF_BYTES)
+    final = len(prefix) < SNIFF_BYTES
+    candidates = []
+    for encoding in encodings:
+        try:
+            # Incremental decoding tolerates a multi-byte sequence cut at the boundary
+            codecs.getincrementaldecoder(encoding)().decode(prefix, final=final)
+        except UnicodeDecodeError:
+            continue
+        candidates.append(encoding)
+    return candidates
+
+
+def _read_text_csv(filepath: str, encoding: str, use_pyarrow: bool) -> pd.DataFrame:
+    options = dict(sep=';', encoding=encoding, dtype=str, keep_default_na=False)
+    if use_pyarrow and PYARROW_AVAILABLE:
+        try:
+            return pd.read_csv(filepath, engine='pyarrow', **options)
+        except pd.errors.ParserError as exc:
+            # pyarrow rejects ragged rows that the C parser pads or truncates
+            logger.debug(f"pyarrow could not parse {filepath} ({exc}); using the C parser")
+    return pd.read_csv(filepath, index_col=False, **options)
+
+
+def read_german_csv(
+    filepath: str, encodings: list[str], use_pyarrow: bool = False
+) -> pd.DataFrame | None:
+    """
+    Read a semicolon-delimited export with every cell as text.
+
+    Candidate encodings come from a prefix sniff and the file is parsed
+    optimistically in a single pass; a decode error later in the file restarts
+    the parse with the next candidate. Short rows are padded with ''.
+
+    Args:
+        filepath: Path to the export
+        encodings: Encodings to try, in preference order
+        use_pyarrow: Parse with pyarrow when it is installed, falling back to
+            the C parser for ragged rows
+
+    Returns:
+        DataFrame of raw text cells, or None if no encoding decodes the file
+    """
+    for encoding in sniff_encodings(filepath, encodings):
+        try:
+            return _read_text_csv(filepath, encoding, use_pyarrow)
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame()
+        except UnicodeDecodeError:
+            logger.warning(f"{Path(filepath).name} is not valid {encoding} past the first {SNIFF_BYTES} bytes; retrying")
+    return None
+
+
+def parse_decimal_column(values: pd.Series) -> pd.Series:
+    """Parse German decimals ("1.234,56") to float, blanks and junk to NULL."""
+    cleaned = values.str.replace('.', '', regex=False).str.replace(',', '.', regex=False).str.strip()
+    return pd.to_numeric(cleaned, errors='coerce')
+
+
+def parse_date_column(values: pd.Series) -> pd.Series:
+    """Convert DD.MM.YYYY to YYYY-MM-DD strings, invalid dates to NULL."""
+    parsed = pd.to_datetime(values.str.strip(), format='%d.%m.%Y', errors='coerce')
+    return parsed.dt.strftime('%Y-%m-%d').astype(object).where(parsed.notna(), None)
+
+
+def parse_text_column(values: pd.Series) -> pd.Series:
+    """Strip text cells; empty cells become NULL."""
+    return values.str.strip().astype(object).where(values != '', None)
+
+
+def build_staging_records(
+    raw: pd.DataFrame,
+    col_idx: dict[str, int],
+    field_parsers: dict[str, Callable[[pd.Series], pd.Series]],
+    source_file: str,
+) -> pd.DataFrame:
+    """Convert raw export columns to staging columns in one vectorized pass per column."""
+    records = pd.DataFrame(index=raw.index)
+    for column_name, parser in field_parsers.items():
+        index = col_idx.get(column_name)
+        records[column_name] = parser(raw.iloc[:, index]) if index is not None else None
+    records['source_file'] = source_file
+    return records
+
+
+def append_records(conn: sqlite3.Connection, table: str, records: pd.DataFrame) -> int:
+    """Append staging records with multi-row INSERTs in one transaction; returns the row count."""
+    # IMMEDIATE takes the write lock up front, so loaders running side by side
+    # wait on the busy timeout instead of failing to upgrade a read transaction
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not records.empty:
+            records.to_sql(
+                table,
+                conn,
+                if_exists='append',
+                index=False,
+                method='multi',
+                chunksize=max(1, SQLITE_MAX_VARIABLES // len(records.columns)),
+            )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(records)
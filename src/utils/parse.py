@@ -29,6 +29,28 @@ def parse_german_decimal(value: str) -> Decimal | None:
         return None
 
 
+def parse_german_float(value: str) -> float | None:
+    """
+    Convert German decimal format straight to float.
+    
+    Same separator rules as parse_german_decimal, without building a Decimal
+    first; use it where the result is stored as a float anyway.
+    Examples: "1.234,56" -> 1234.56, "47,53" -> 47.53
+    
+    Args:
+        value: String in German decimal format
+        
+    Returns:
+        float or None if parsing fails
+    """
+    if not value or value.strip() == "":
+        return None
+    try:
+        return float(value.replace(".", "").replace(",", "."))
+    except ValueError:
+        return None
+
+
 def parse_german_date(date_str: str) -> str | None:
     """
     Convert German date format DD.MM.YYYY to YYYY-MM-DD.
@@ -41,8 +63,20 @@ def parse_german_date(date_str: str) -> str | None:
     """
     if not date_str or date_str.strip() == "":
         return None
+    date_str = date_str.strip()
+    # Fast path for the fixed-width DD.MM.YYYY form: validate via the datetime
+    # constructor and reorder the slices instead of going through strptime
+    if len(date_str) == 10 and date_str[2] == "." and date_str[5] == ".":
+        day, month, year = date_str[:2], date_str[3:5], date_str[6:]
+        digits = day + month + year
+        if digits.isascii() and digits.isdigit():
+            try:
+                datetime(int(year), int(month), int(day))
+            except ValueError:
+                return None
+            return f"{year}-{month}-{day}"
     try:
-        dt = datetime.strptime(date_str.strip(), "%d.%m.%Y")
+        dt = datetime.strptime(date_str, "%d.%m.%Y")
         return dt.strftime("%Y-%m-%d")
     except Exception:
         return None
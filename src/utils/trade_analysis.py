@@ -0,0 +1,168 @@
+"""
+Shared helpers for the buy/sell analysis scripts (analyze_comdirect.py and
+analyze_transactions.py): German number/date columns, FIFO matching and the
+result CSV writer.
+"""
+
+import csv
+import re
+from dataclasses import fields
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+FLOAT_TOLERANCE = 1e-9
+# Write buffer for result files; fewer, larger syscalls on big reports
+IO_BUFFER_SIZE = 1 << 20
+_CSV_SPECIAL = re.compile(r'[,"\r\n]')
+
+
+class ColumnMapping:
+    """Mixin for a dataclass holding the raw CSV header of each logical column."""
+
+    __slots__ = ()
+
+    def mapping(self) -> Dict[str, str]:
+        """Return {raw header: logical name} for the columns that were found."""
+        return {
+            getattr(self, field.name): field.name
+            for field in fields(self)
+            if getattr(self, field.name) is not None
+        }
+
+
+def resolve_columns(
+    fieldnames: List[str],
+    matchers: Sequence[Tuple[str, Callable[[str], bool]]],
+) -> Dict[str, Optional[str]]:
+    """Resolve the fuzzy header matches once per file instead of once per row."""
+    resolved: Dict[str, Optional[str]] = {}
+    used: set[str] = set()
+    for logical, matches in matchers:
+        resolved[logical] = None
+        for column in fieldnames:
+            if column not in used and matches(column):
+                resolved[logical] = column
+                used.add(column)
+                break
+    return resolved
+
+
+def read_header(filepath: str, encoding: str) -> List[str]:
+    """Read only the header row; no per-row dicts are ever built."""
+    with open(filepath, 'r', encoding=encoding, newline='') as f:
+        header = next(csv.reader(f, delimiter=';'), [])
+    # pandas drops a UTF-8 BOM, so the resolved names must not carry it either
+    if header:
+        header[0] = header[0].lstrip('\ufeff')
+    return header
+
+
+def parse_german_dates(values: pd.Series) -> pd.Series:
+    """Parse DD.MM.YYYY strings, converting each distinct date only once."""
+    # Exports repeat the same booking days many times; factorize dedupes them
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(uniques, format='%d.%m.%Y', errors='coerce').to_numpy()
+    # Trailing NaT catches the -1 code pandas uses for missing values
+    parsed = np.append(parsed, np.array(['NaT'], dtype=parsed.dtype))
+    return pd.Series(parsed[codes], index=values.index)
+
+
+def _fmt_de(d) -> str:
+    """Format a date as DD.MM.YYYY without going through strftime."""
+    return f"{d.day:02d}.{d.month:02d}.{d.year:04d}"
+
+
+def format_german_dates(values: pd.Series) -> pd.Series:
+    """Format parsed dates as DD.MM.YYYY, formatting each distinct date once."""
+    codes, uniques = pd.factorize(values)
+    labels = np.array([_fmt_de(d) for d in uniques] + [''], dtype=object)
+    return pd.Series(labels[codes], index=values.index)
+
+
+def parse_german_numbers(values: pd.Series) -> pd.Series:
+    """Return float64 values; the C parser already handled the regular cells."""
+    parsed = pd.to_numeric(values, errors='coerce')
+    if values.dtype == object or pd.api.types.is_string_dtype(values):
+        # Only cells the C parser left as text (e.g. padded with spaces) get
+        # the German separator treatment in Python
+        failed = parsed.isna() & values.notna()
+        if failed.any():
+            cleaned = (values[failed].astype(str).str.strip()
+                       .str.replace('.', '', regex=False)
+                       .str.replace(',', '.', regex=False))
+            parsed[failed] = pd.to_numeric(cleaned, errors='coerce')
+    return parsed.astype(np.float64).fillna(0.0)
+
+
+def fifo_match(
+    buy_shares: np.ndarray,
+    sell_shares: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Match sells against earlier buys (FIFO) on float64 share arrays.
+
+    Only walks the share cursors; returns (buy_idx, sell_idx, shares) arrays
+    with one entry per match so callers can gather prices and amounts by index.
+    A buy index of -1 marks sold shares that have no buy in the data (bought
+    before the data period).
+    """
+    # Python floats are much cheaper to index one by one than ndarray elements
+    remaining_buys = buy_shares.tolist()
+    buy_idx: List[int] = []
+    sell_idx: List[int] = []
+    shares: List[float] = []
+    # First buy that still has shares; everything before it is exhausted
+    buy_cursor = 0
+
+    for s, sell_total in enumerate(sell_shares.tolist()):
+        if abs(sell_total) <= FLOAT_TOLERANCE:
+            continue
+
+        while buy_cursor < len(remaining_buys) and abs(remaining_buys[buy_cursor]) <= FLOAT_TOLERANCE:
+            buy_cursor += 1
+
+        remaining_shares = sell_total
+        for b in range(buy_cursor, len(remaining_buys)):
+            if abs(remaining_buys[b]) <= FLOAT_TOLERANCE:
+                continue
+            if remaining_shares <= FLOAT_TOLERANCE:
+                break
+
+            # How many shares from this buy are we selling?
+            shares_to_match = min(remaining_shares, remaining_buys[b])
+            buy_idx.append(b)
+            sell_idx.append(s)
+            shares.append(shares_to_match)
+
+            remaining_buys[b] -= shares_to_match
+            remaining_shares -= shares_to_match
+
+        if remaining_shares > FLOAT_TOLERANCE:
+            buy_idx.append(-1)
+            sell_idx.append(s)
+            shares.append(remaining_shares)
+
+    return (
+        np.array(buy_idx, dtype=np.int64),
+        np.array(sell_idx, dtype=np.int64),
+        np.array(shares, dtype=np.float64),
+    )
+
+
+def write_results_csv(output_file: str, header: List[str], results: List[Tuple]):
+    """Write results as CSV, joining the lines and writing them in one call."""
+    # Only the security name can contain characters that need quoting
+    if any(_CSV_SPECIAL.search(row[0]) for row in results):
+        with open(output_file, 'w', newline='', encoding='utf-8', buffering=IO_BUFFER_SIZE) as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(results)
+        return
+
+    lines = [','.join(header)]
+    lines.extend(','.join(map(str, row)) for row in results)
+    with open(output_file, 'w', newline='', encoding='utf-8', buffering=IO_BUFFER_SIZE) as f:
+        # csv.writer terminates rows with \r\n; keep the output byte-identical
+        f.write('\r\n'.join(lines) + '\r\n')
@@ -229,5 +229,152 @@ class AllocateDividendsTest(unittest.TestCase):
                 self.assertTrue(math.isclose(row[3], exp_amount, rel_tol=1e-9))
 
 
+class AllocationEdgeCasesTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp_dir.cleanup)
+        self.db_path = Path(self._tmp_dir.name) / "edge_cases.db"
+        self.conn = sqlite3.connect(self.db_path)
+        self.cursor = self.conn.cursor()
+
+        create_broker_t(self.cursor)
+        create_security_t(self.cursor)
+        create_transaction_t(self.cursor)
+        create_transaction_match_t(self.cursor)
+        create_dividend_allocation_t(self.cursor)
+
+        self.cursor.execute("INSERT INTO broker_t (broker_name) VALUES (?)", ("edge",))
+        self.broker_id = self.cursor.lastrowid
+        self.cursor.execute(
+            "INSERT INTO security_t (security_name, asset_type) VALUES (?, ?)",
+            ("Edge Equity", "stock"),
+        )
+        self.security_id = self.cursor.lastrowid
+
+    def insert_transaction(self, tx_date, tx_type: str, shares: float, amount: float) -> int:
+        self.cursor.execute(
+            """
+            INSERT INTO transaction_t
+                (security_id, broker_id, transaction_date, transaction_type,
+                 shares, total_value, net_amount, allocated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+            """,
+            (self.security_id, self.broker_id, tx_date, tx_type, shares, amount, amount),
+        )
+        return self.cursor.lastrowid
+
+    def insert_match(self, buy_id: int, sell_date: str, shares: float) -> int:
+        sell_id = self.insert_transaction(sell_date, "sell", shares, shares * 12)
+        self.cursor.execute(
+            """
+            INSERT INTO transaction_match_t
+                (broker_id, security_id, buy_transaction_id, sell_transaction_id,
+                 shares, allocated_cost, allocated_proceeds)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (self.broker_id, self.security_id, buy_id, sell_id, shares, shares * 10, shares * 12),
+        )
+        return sell_id
+
+    def run_allocation(self):
+        self.conn.commit()
+        self.conn.close()
+        stats = allocate_dividends(str(self.db_path))
+
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(
+            """
+            SELECT dividend_transaction_id, buy_transaction_id, shares, allocated_amount
+            FROM dividend_allocation_t
+            ORDER BY dividend_transaction_id, id
+            """
+        ).fetchall()
+        conn.close()
+        return stats, rows
+
+    def assertAllocations(self, rows, expected):
+        self.assertEqual(len(rows), len(expected))
+        for row, (exp_dividend, exp_buy, exp_shares, exp_amount) in zip(rows, expected):
+            self.assertEqual(row[0], exp_dividend)
+            self.assertEqual(row[1], exp_buy)
+            self.assertTrue(math.isclose(row[2], exp_shares, rel_tol=1e-9))
+            self.assertTrue(math.isclose(row[3], exp_amount, rel_tol=1e-9))
+
+    def test_declared_shares_below_available_fill_oldest_lots_first(self):
+        first_buy = self.insert_transaction("2024-01-10", "buy", 100.0, -1000.0)
+        second_buy = self.insert_transaction("2024-02-10", "buy", 50.0, -500.0)
+        dividend = self.insert_transaction("2024-05-10", "dividend", 120.0, 240.0)
+
+        stats, rows = self.run_allocation()
+
+        self.assertEqual(stats["dividends_allocated"], 1)
+        self.assertAllocations(rows, [
+            (dividend, first_buy, 100.0, 200.0),
+            (dividend, second_buy, 20.0, 40.0),
+        ])
+
+    def test_declared_shares_above_available_put_remainder_on_last_lot(self):
+        first_buy = self.insert_transaction("2024-01-10", "buy", 60.0, -600.0)
+        second_buy = self.insert_transaction("2024-02-10", "buy", 40.0, -400.0)
+        dividend = self.insert_transaction("2024-05-10", "dividend", 150.0, 300.0)
+
+        stats, rows = self.run_allocation()
+
+        self.assertEqual(stats["dividends_allocated"], 1)
+        # 100 of the 150 declared shares are held; the other 50 shares' amount
+        # goes to the last lot so the whole dividend is allocated
+        self.assertAllocations(rows, [
+            (dividend, first_buy, 60.0, 120.0),
+            (dividend, second_buy, 40.0, 180.0),
+        ])
+        self.assertTrue(math.isclose(sum(row[3] for row in rows), 300.0, rel_tol=1e-12))
+
+    def test_segments_of_one_lot_are_summed_into_one_allocation(self):
+        first_buy = self.insert_transaction("2024-01-10", "buy", 100.0, -1000.0)
+        second_buy = self.insert_transaction("2024-02-10", "buy", 40.0, -400.0)
+        # The first lot is split into two sold segments and an open remainder
+        self.insert_match(first_buy, "2024-06-01", 30.0)
+        self.insert_match(first_buy, "2024-07-01", 20.0)
+        dividend = self.insert_transaction("2024-05-10", "dividend", 140.0, 280.0)
+
+        stats, rows = self.run_allocation()
+
+        self.assertEqual(stats["dividends_allocated"], 1)
+        self.assertEqual(stats["allocations_created"], 2)
+        self.assertAllocations(rows, [
+            (dividend, first_buy, 100.0, 200.0),
+            (dividend, second_buy, 40.0, 80.0),
+        ])
+
+    def test_dividend_without_date_is_not_a_predecessor(self):
+        sold_buy = self.insert_transaction("2024-01-10", "buy", 30.0, -300.0)
+        self.insert_match(sold_buy, "2024-03-01", 30.0)
+        open_buy = self.insert_transaction("2024-02-10", "buy", 50.0, -500.0)
+        undated = self.insert_transaction(None, "dividend", 0.0, 10.0)
+        first_dividend = self.insert_transaction("2024-04-01", "dividend", 0.0, 80.0)
+        second_dividend = self.insert_transaction("2024-06-01", "dividend", 0.0, 50.0)
+
+        stats, rows = self.run_allocation()
+
+        self.assertEqual(stats["dividends_processed"], 3)
+        self.assertEqual(stats["dividends_allocated"], 2)
+        self.assertEqual(stats["dividends_failed"], 1)
+        # Without a dated predecessor the first dividend still counts the lot
+        # sold before it; the second only counts shares held since the first
+        self.assertAllocations(rows, [
+            (first_dividend, sold_buy, 30.0, 30.0),
+            (first_dividend, open_buy, 50.0, 50.0),
+            (second_dividend, open_buy, 50.0, 50.0),
+        ])
+
+        conn = sqlite3.connect(self.db_path)
+        error_message, allocated = conn.execute(
+            "SELECT error_message, allocated FROM transaction_t WHERE id = ?", (undated,)
+        ).fetchone()
+        conn.close()
+        self.assertEqual(error_message, "Missing transaction_date on dividend")
+        self.assertEqual(allocated, 0)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,66 @@
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+import unittest
+
+import pandas as pd
+
+from src.repository.connection import BUSY_TIMEOUT_SECONDS, connect_staging_db
+from src.utils.loader import append_records
+
+
+class ConcurrentLoadersTest(unittest.TestCase):
+    def test_second_loader_waits_for_the_first_to_commit(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = str(Path(tmp_dir) / "staging.db")
+            setup = sqlite3.connect(db_path)
+            setup.execute("CREATE TABLE first_staging_t (value INTEGER)")
+            setup.execute("CREATE TABLE second_staging_t (value INTEGER)")
+            setup.close()
+
+            # The first loader holds the write lock for its whole insert
+            first = connect_staging_db(db_path)
+            first.execute("BEGIN IMMEDIATE")
+            first.execute("INSERT INTO first_staging_t (value) VALUES (1)")
+
+            records = pd.DataFrame({"value": [1, 2, 3]})
+            outcome = {}
+
+            def load_second():
+                second = connect_staging_db(db_path)
+                try:
+                    outcome["rows"] = append_records(second, "second_staging_t", records)
+                except Exception as exc:  # pragma: no cover - reported below
+                    outcome["error"] = exc
+                finally:
+                    second.close()
+
+            worker = threading.Thread(target=load_second)
+            worker.start()
+            time.sleep(0.3)
+            self.assertTrue(worker.is_alive(), "second loader did not wait for the lock")
+
+            first.commit()
+            worker.join(timeout=10)
+            self.assertFalse(worker.is_alive())
+            self.assertNotIn("error", outcome)
+            self.assertEqual(outcome["rows"], 3)
+
+            count = first.execute("SELECT COUNT(*) FROM second_staging_t").fetchone()[0]
+            self.assertEqual(count, 3)
+            first.close()
+
+    def test_busy_timeout_outlasts_a_large_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            conn = connect_staging_db(str(Path(tmp_dir) / "staging.db"))
+            busy_timeout_ms = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+            conn.close()
+        # Well above sqlite3's 5 s default
+        self.assertEqual(busy_timeout_ms, BUSY_TIMEOUT_SECONDS * 1000)
+        self.assertGreaterEqual(BUSY_TIMEOUT_SECONDS, 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,25 @@
+import math
 import sqlite3
 import tempfile
-from datetime import date
+from datetime import date, timedelta
 from pathlib import Path
 import unittest
 
-from src.etl.portfolio_xirr import calculate_portfolio_xirr
-from src.repository.create_db import create_security_t, create_transaction_t
+from unittest import mock
+
+from src.etl import portfolio_xirr
+from src.etl.portfolio_xirr import (
+    _float_midpoint,
+    _xirr_from_cashflows,
+    calculate_portfolio_xirr,
+    calculate_portfolio_xirr_closed_positions,
+)
+from src.repository.create_db import (
+    create_dividend_allocation_t,
+    create_security_t,
+    create_transaction_match_t,
+    create_transaction_t,
+)
 
 
 class PortfolioXirrTest(unittest.TestCase):
@@ -51,5 +65,321 @@ class PortfolioXirrTest(unittest.TestCase):
             self.assertTrue(abs(xirr) < 1e-6)
 
 
+def _write_portfolio(db_path, sell_amount):
+    """Create a one-stock portfolio bought for 1000 and sold a year later."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    create_security_t(cursor)
+    create_transaction_t(cursor)
+    cursor.execute(
+        "INSERT INTO security_t (security_name, asset_type) VALUES (?, ?)",
+        ("Test Stock", "stock"),
+    )
+    cursor.executemany(
+        """
+        INSERT INTO transaction_t
+            (security_id, broker_id, transaction_date, transaction_type,
+             shares, price_per_share, total_value, net_amount)
+        VALUES (?, 1, ?, ?, 10.0, ?, ?, ?)
+        """,
+        [
+            (cursor.lastrowid, "2023-01-01", "buy", 100.0, -1000.0, -1000.0),
+            (cursor.lastrowid, "2024-01-01", "sell", sell_amount / 10, sell_amount, sell_amount),
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+def _one_year_rate(sell_amount):
+    # 2023-01-01 to 2024-01-01 is 365 days on a 365.25-day year
+    return (sell_amount / 1000.0) ** (365.25 / 365) - 1
+
+
+class ConnectionTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = Path(tmp_dir.name)
+
+    def open_connections(self, calculate, db_path):
+        connections = []
+        original_open_conn = portfolio_xirr._open_conn
+
+        def open_conn(path):
+            conn = original_open_conn(path)
+            connections.append(conn)
+            return conn
+
+        with mock.patch.object(portfolio_xirr, "_open_conn", side_effect=open_conn):
+            calculate(str(db_path))
+        return connections
+
+    def assertClosed(self, conn):
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+    def test_connections_are_closed_after_each_call(self):
+        db_path = self.tmp_path / "portfolio.db"
+        _write_portfolio(db_path, 1100.0)
+        for calculate in (calculate_portfolio_xirr, calculate_portfolio_xirr_closed_positions):
+            with self.subTest(calculate=calculate.__name__):
+                connections = self.open_connections(calculate, db_path)
+                self.assertEqual(len(connections), 1)
+                self.assertClosed(connections[0])
+
+    def test_replaced_database_file_is_read_afresh(self):
+        db_path = self.tmp_path / "portfolio.db"
+        _write_portfolio(db_path, 1100.0)
+        self.assertAlmostEqual(calculate_portfolio_xirr(str(db_path)), _one_year_rate(1100.0), places=9)
+
+        db_path.unlink()
+        _write_portfolio(db_path, 1200.0)
+        self.assertAlmostEqual(calculate_portfolio_xirr(str(db_path)), _one_year_rate(1200.0), places=9)
+
+    def test_read_path_keeps_the_journal_mode(self):
+        db_path = self.tmp_path / "portfolio.db"
+        _write_portfolio(db_path, 1100.0)
+        calculate_portfolio_xirr(str(db_path))
+
+        conn = sqlite3.connect(db_path)
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        conn.close()
+        self.assertEqual(journal_mode, "delete")
+        self.assertFalse((self.tmp_path / "portfolio.db-wal").exists())
+
+
+def _write_closed_positions(db_path):
+    """Create partially sold lots with dividends in a stock and an ETF."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    create_security_t(cursor)
+    create_transaction_t(cursor)
+    create_transaction_match_t(cursor)
+    create_dividend_allocation_t(cursor)
+
+    def insert_security(name, asset_type):
+        cursor.execute(
+            "INSERT INTO security_t (security_name, asset_type) VALUES (?, ?)",
+            (name, asset_type),
+        )
+        return cursor.lastrowid
+
+    def insert_transaction(security_id, tx_date, tx_type, shares, amount):
+        cursor.execute(
+            """
+            INSERT INTO transaction_t
+                (security_id, broker_id, transaction_date, transaction_type,
+                 shares, total_value, net_amount)
+            VALUES (?, 1, ?, ?, ?, ?, ?)
+            """,
+            (security_id, tx_date, tx_type, shares, amount, amount),
+        )
+        return cursor.lastrowid
+
+    def insert_match(security_id, buy_id, sell_id, shares, cost, proceeds):
+        cursor.execute(
+            """
+            INSERT INTO transaction_match_t
+                (broker_id, security_id, buy_transaction_id, sell_transaction_id,
+                 shares, allocated_cost, allocated_proceeds)
+            VALUES (1, ?, ?, ?, ?, ?, ?)
+            """,
+            (security_id, buy_id, sell_id, shares, cost, proceeds),
+        )
+
+    def insert_dividend(security_id, buy_id, tx_date, amount):
+        dividend_id = insert_transaction(security_id, tx_date, "dividend", 0.0, amount)
+        cursor.execute(
+            """
+            INSERT INTO dividend_allocation_t
+                (broker_id, security_id, dividend_transaction_id, buy_transaction_id,
+                 shares, allocated_amount)
+            VALUES (1, ?, ?, ?, 0.0, ?)
+            """,
+            (security_id, dividend_id, buy_id, amount),
+        )
+
+    stock = insert_security("Test Stock", "stock")
+    first_buy = insert_transaction(stock, "2022-01-10", "buy", 100.0, -1000.0)
+    second_buy = insert_transaction(stock, "2022-03-15", "buy", 50.0, -550.0)
+    open_buy = insert_transaction(stock, "2022-04-01", "buy", 30.0, -330.0)
+    first_sell = insert_transaction(stock, "2022-06-01", "sell", 40.0, 480.0)
+    second_sell = insert_transaction(stock, "2023-02-01", "sell", 80.0, 920.0)
+    # The first lot is sold in two parts, the second lot only partly
+    insert_match(stock, first_buy, first_sell, 40.0, 400.0, 480.0)
+    insert_match(stock, first_buy, second_sell, 60.0, 600.0, 690.0)
+    insert_match(stock, second_buy, second_sell, 20.0, 220.0, 230.0)
+    insert_dividend(stock, first_buy, "2022-05-10", 50.0)
+    insert_dividend(stock, second_buy, "2022-05-10", 25.0)
+    # Lots that were never sold do not contribute their dividends
+    insert_dividend(stock, open_buy, "2022-05-10", 15.0)
+
+    etf = insert_security("Test ETF", "etf")
+    etf_buy = insert_transaction(etf, "2022-02-01", "buy", 10.0, -500.0)
+    etf_sell = insert_transaction(etf, "2023-02-01", "sell", 10.0, 520.0)
+    insert_match(etf, etf_buy, etf_sell, 10.0, 500.0, 520.0)
+    insert_dividend(etf, etf_buy, "2022-07-01", 5.0)
+
+    conn.commit()
+    conn.close()
+
+
+class ClosedPositionsXirrTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.db_path = str(Path(tmp_dir.name) / "portfolio.db")
+
+    def test_partial_matches_and_dividends(self):
+        _write_closed_positions(self.db_path)
+        # Reference values from the per-lot flows
+        for asset_type, expected in (
+            (None, 0.2015584906),
+            ("stock", 0.2839784061),
+            ("etf", 0.0503285568),
+        ):
+            with self.subTest(asset_type=asset_type):
+                xirr = calculate_portfolio_xirr_closed_positions(self.db_path, asset_type)
+                self.assertAlmostEqual(xirr, expected, places=9)
+
+    def test_no_matched_lots(self):
+        _write_closed_positions(self.db_path)
+        with self.assertLogs(portfolio_xirr.logger, level="INFO") as logs:
+            self.assertIsNone(calculate_portfolio_xirr_closed_positions(self.db_path, "bond"))
+        self.assertIn("No matched BUY/SELL lots available for XIRR (bond)", logs.output[0])
+
+
+def _npv(cashflows, rate):
+    start_date = cashflows[0][0]
+    return sum(
+        amount / (1.0 + rate) ** ((flow_date - start_date).days / 365.25)
+        for flow_date, amount in cashflows
+    )
+
+
+class XirrFromCashflowsTest(unittest.TestCase):
+    start = date(2020, 1, 1)
+
+    def assertRoot(self, cashflows, rate):
+        self.assertIsNotNone(rate)
+        self.assertLess(abs(_npv(cashflows, rate)), 1e-7)
+
+    def test_known_rate(self):
+        cashflows = [(self.start, -1000.0), (date(2021, 1, 1), 1100.0)]
+        rate = _xirr_from_cashflows(cashflows)
+        self.assertAlmostEqual(rate, 1.1 ** (365.25 / 366) - 1, places=9)
+        self.assertRoot(cashflows, rate)
+
+    def test_multiple_roots_returns_one_of_them(self):
+        cashflows = [
+            (self.start, -1000.0),
+            (self.start + timedelta(days=365), 2300.0),
+            (self.start + timedelta(days=730), -1320.0),
+        ]
+        rate = _xirr_from_cashflows(cashflows)
+        self.assertRoot(cashflows, rate)
+        self.assertTrue(0.09 < rate < 0.11 or 0.19 < rate < 0.21, rate)
+
+    def test_rate_near_total_loss(self):
+        cashflows = [(self.start, -1000.0), (self.start + timedelta(days=365), 0.5)]
+        rate = _xirr_from_cashflows(cashflows)
+        self.assertRoot(cashflows, rate)
+        self.assertLess(rate, -0.999)
+
+    def test_noise_limited_rate_near_total_loss(self):
+        # Discount factors near -1 swamp the 1e-7 NPV tolerance in rounding noise
+        cashflows = [
+            (date(2015, 1, 21), 71625.75),
+            (date(2018, 4, 9), 498.42),
+            (date(2019, 5, 29), -0.21),
+        ]
+        rate = _xirr_from_cashflows(cashflows)
+        self.assertIsNotNone(rate)
+        step = 1e-9 * abs(rate)
+        self.assertLess(_npv(cashflows, rate - step) * _npv(cashflows, rate + step), 0.0)
+
+    def test_very_large_rate(self):
+        cashflows = [(self.start, -1.0), (self.start + timedelta(days=365), 1e5)]
+        rate = _xirr_from_cashflows(cashflows)
+        self.assertRoot(cashflows, rate)
+        self.assertGreater(rate, 1e5)
+
+    def test_converges_when_npv_tolerance_is_unreachable(self):
+        # At this scale one ulp of the rate moves the NPV by more than 1e-7
+        cashflows = [(self.start, -1e12), (self.start + timedelta(days=400), 1.3e12)]
+        rate = _xirr_from_cashflows(cashflows)
+        self.assertIsNotNone(rate)
+        self.assertTrue(math.isclose(rate, 1.3 ** (365.25 / 400) - 1, rel_tol=1e-12), rate)
+
+    def test_wide_bracket_converges_within_bisection_bound(self):
+        # The doubling search brackets this root between -0.9999 and 1638.4
+        cashflows = [(self.start, -1.0), (self.start + timedelta(days=365), 1000.0)]
+        with mock.patch.object(portfolio_xirr, "ROOT_MAX_ITERATIONS", 128):
+            rate = _xirr_from_cashflows(cashflows)
+        self.assertRoot(cashflows, rate)
+
+    def test_negative_root_in_bracket_crossing_zero(self):
+        cashflows = [(self.start, -100.0), (self.start + timedelta(days=365), 50.0)]
+        with mock.patch.object(portfolio_xirr, "ROOT_MAX_ITERATIONS", 128):
+            rate = _xirr_from_cashflows(cashflows)
+        self.assertRoot(cashflows, rate)
+        self.assertLess(rate, 0.0)
+
+    def test_float_midpoint_reaches_adjacent_floats_within_64_steps(self):
+        for low, high, target in ((-0.9999, 1e6, 0.0123), (-0.9999, 1e6, -0.75), (0.1, 1e6, 5e5)):
+            steps = 0
+            while True:
+                mid = _float_midpoint(low, high)
+                self.assertTrue(low <= mid <= high)
+                if mid in (low, high):
+                    break
+                if mid < target:
+                    low = mid
+                else:
+                    high = mid
+                steps += 1
+            self.assertLessEqual(steps, 64)
+            self.assertLessEqual(low, target)
+            self.assertLessEqual(target, high)
+
+    def count_npv_evaluations(self, cashflows):
+        # Every NPV-and-slope evaluation of the root search takes one math.log1p
+        with mock.patch.object(portfolio_xirr.math, "log1p", wraps=math.log1p) as log1p:
+            rate = _xirr_from_cashflows(cashflows)
+        return rate, log1p.call_count
+
+    def test_typical_portfolio_needs_few_evaluations(self):
+        # Five years of a monthly savings plan with quarterly dividends
+        flows = [(self.start + timedelta(days=30 * month), -100.0) for month in range(60)]
+        flows += [(self.start + timedelta(days=91 * quarter + 45), 12.0) for quarter in range(20)]
+        flows.sort()
+        for final_value in (3000.0, 6500.0, 9000.0, 20000.0):
+            with self.subTest(final_value=final_value):
+                cashflows = flows + [(date(2025, 6, 30), final_value)]
+                rate, evaluations = self.count_npv_evaluations(cashflows)
+                self.assertRoot(cashflows, rate)
+                self.assertLessEqual(evaluations, 10)
+
+    def test_wide_brackets_need_few_evaluations(self):
+        cases = (
+            # Bracketed between -0.9999 and 1638.4, across zero
+            [(self.start, -1.0), (self.start + timedelta(days=365), 1000.0)],
+            [(self.start, -100.0), (self.start + timedelta(days=365), 50.0)],
+            # Bracketed on one side of zero, orders of magnitude wide
+            [(self.start, -1.0), (self.start + timedelta(days=365), 1e5)],
+            [(self.start, -1000.0), (self.start + timedelta(days=365), 0.5)],
+        )
+        for cashflows in cases:
+            with self.subTest(cashflows=cashflows):
+                rate, evaluations = self.count_npv_evaluations(cashflows)
+                self.assertRoot(cashflows, rate)
+                self.assertLessEqual(evaluations, 20)
+
+    def test_single_sign_flows_have_no_rate(self):
+        cashflows = [(self.start, -1000.0), (self.start + timedelta(days=365), -10.0)]
+        self.assertIsNone(_xirr_from_cashflows(cashflows))
+
+
 if __name__ == "__main__":
     unittest.main()